@@ -0,0 +1,59 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+wsgi_app = "social_media_platform_api.wsgi:application"
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+
+# Load Django once in the master and fork workers from it, so imports, URL
+# resolvers, serializer metadata and the rendered schema are shared
+# copy-on-write instead of being rebuilt by every worker.
+preload_app = os.environ.get("GUNICORN_PRELOAD", "1") == "1"
+
+# Every worker writes its metrics to a file in this directory and /metrics
+# sums them. Start from an empty one so old workers' files don't count.
+os.environ.setdefault(
+    "METRICS_DIR", os.path.join(tempfile.gettempdir(), "social_media_metrics")
+)
+shutil.rmtree(os.environ["METRICS_DIR"], ignore_errors=True)
+os.makedirs(os.environ["METRICS_DIR"])
+
+# Workers take snowflake worker ids SNOWFLAKE_WORKER_ID, +1, ..., one per
+# slot. Ids derived from process ids can collide, so refuse to start
+# without it.
+if "SNOWFLAKE_WORKER_ID" not in os.environ:
+    raise RuntimeError(
+        "Set SNOWFLAKE_WORKER_ID to the first of this server's snowflake "
+        "worker ids; servers sharing a database need ranges that don't overlap."
+    )
+
+
+def when_ready(server):
+    # Runs in the master after the app is loaded and before any worker forks.
+    if preload_app:
+        from social_media_platform_api.warmup import warm_up
+
+        warm_up()
+
+
+def pre_fork(server, worker):
+    # Runs in the master: take the lowest slot no live worker holds, so a
+    # replacement worker reuses its predecessor's id.
+    taken = {other.snowflake_slot for other in server.WORKERS.values()}
+    worker.snowflake_slot = min(set(range(len(taken) + 1)) - taken)
+
+
+def child_exit(server, worker):
+    # Runs in the master. A worker that died mid-request left its requests
+    # counted as in flight.
+    from social_media_platform_api.metrics import mark_process_dead
+
+    mark_process_dead(worker.pid, os.environ["METRICS_DIR"])
+
+
+def post_fork(server, worker):
+    from social_media_platform_api.snowflake import assign_worker_id
+
+    assign_worker_id(int(os.environ["SNOWFLAKE_WORKER_ID"]) + worker.snowflake_slot)
@@ -1,7 +1,258 @@
 from django.contrib import admin
-from profile_services.models import Profile, Like, Post, Comment
+from django.contrib.admin.views.main import ChangeList, ORDER_VAR, PAGE_VAR
+from django.core.exceptions import PermissionDenied
+from django.core.paginator import Paginator
+from django.db import connections
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils.html import format_html
+from django.utils.functional import cached_property
 
-admin.site.register(Profile)
-admin.site.register(Post)
-admin.site.register(Like)
-admin.site.register(Comment)
+from profile_services.deletion import delete_post, delete_profile, step_name
+from profile_services.models import (
+    Profile,
+    Like,
+    Post,
+    Comment,
+    DeletionJob,
+    ProfilerCapture,
+)
+
+BEFORE_VAR = "before"
+
+
+def estimated_row_count(queryset):
+    """
+    The table size from the planner statistics on PostgreSQL, which is cheap
+    but not exact, otherwise an exact ``COUNT(*)``. (The highest primary key
+    is no estimate: snowflake ids are timestamps.)
+    """
+    model = queryset.model
+    connection = connections[queryset.db]
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                [model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        if row and row[0] >= 0:
+            return row[0]
+    return model._default_manager.using(queryset.db).count()
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Avoids an exact ``COUNT(*)``: an unfiltered changelist uses the
+    estimated table size, a filtered one counts at most ``count_limit``
+    matching rows.
+    """
+
+    count_limit = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimated_row_count(queryset)
+            if estimate > self.count_limit:
+                return estimate
+        return queryset.order_by()[: self.count_limit].count()
+
+
+class KeysetChangeList(ChangeList):
+    """
+    Pages through the default ``-pk`` ordering with ``?before=<pk>``
+    instead of ``OFFSET``, which gets slower the deeper the page.
+    """
+
+    def __init__(self, request, *args, **kwargs):
+        try:
+            self.before = int(request.GET[BEFORE_VAR])
+        except (KeyError, ValueError):
+            self.before = None
+        self.keyset = ORDER_VAR not in request.GET
+        super().__init__(request, *args, **kwargs)
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(BEFORE_VAR, None)
+        return lookup_params
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        if self.keyset and self.before is not None:
+            queryset = queryset.filter(pk__lt=self.before)
+        return queryset
+
+    def get_results(self, request):
+        if self.keyset:
+            self.page_num = 1
+        super().get_results(request)
+
+        self.older_url = self.newest_url = None
+        if self.keyset:
+            page = list(self.result_list)
+            if self.multi_page and page:
+                self.older_url = self.get_query_string(
+                    {BEFORE_VAR: page[-1].pk}, [PAGE_VAR]
+                )
+            if self.before is not None:
+                self.newest_url = self.get_query_string(remove=[BEFORE_VAR, PAGE_VAR])
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    ordering = ("-pk",)
+    change_list_template = "admin/keyset_change_list.html"
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
+
+
+class SoftDeleteAdminMixin:
+    """
+    Deleting marks the objects with ``soft_delete`` and leaves their rows
+    to ``reap_deletions`` instead of cascading in the request. The
+    confirmation page lists the objects themselves, not their dependents.
+    """
+
+    soft_delete = None
+
+    def delete_model(self, request, obj):
+        self.soft_delete(obj)
+
+    def delete_queryset(self, request, queryset):
+        for obj in queryset:
+            self.soft_delete(obj)
+
+    def get_deleted_objects(self, objs, request):
+        objs = list(objs)
+        opts = self.model._meta
+        perms_needed = set()
+        if not self.has_delete_permission(request):
+            perms_needed.add(opts.verbose_name)
+        return (
+            [str(obj) for obj in objs],
+            {opts.verbose_name_plural: len(objs)},
+            perms_needed,
+            [],
+        )
+
+
+@admin.register(Profile)
+class ProfileAdmin(SoftDeleteAdminMixin, LargeTableAdmin):
+    list_display = ("id", "user", "bio")
+    list_select_related = ("user",)
+    raw_id_fields = ("user", "followers", "following")
+    search_fields = ("user__username",)
+    soft_delete = staticmethod(delete_profile)
+
+
+@admin.register(Post)
+class PostAdmin(SoftDeleteAdminMixin, LargeTableAdmin):
+    list_display = ("id", "user", "post_description", "created_at")
+    list_select_related = ("user",)
+    raw_id_fields = ("user", "profile", "tags")
+    soft_delete = staticmethod(delete_post)
+
+
+@admin.register(Like)
+class LikeAdmin(LargeTableAdmin):
+    list_display = ("id", "user", "post_id", "created_at")
+    list_select_related = ("user",)
+    raw_id_fields = ("user", "post")
+
+
+@admin.register(Comment)
+class CommentAdmin(LargeTableAdmin):
+    list_display = ("id", "user", "post_id", "parent_id", "content", "created_at")
+    list_select_related = ("user",)
+    raw_id_fields = ("user", "post", "parent")
+
+
+@admin.register(DeletionJob)
+class DeletionJobAdmin(admin.ModelAdmin):
+    list_display = (
+        "id",
+        "kind",
+        "object_id",
+        "current_step",
+        "progress",
+        "created_at",
+        "finished_at",
+    )
+    list_filter = ("kind", ("finished_at", admin.EmptyFieldListFilter))
+    ordering = ("-id",)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    @admin.display(description="step")
+    def current_step(self, obj):
+        return step_name(obj)
+
+    @admin.display(description="progress")
+    def progress(self, obj):
+        if obj.rows_total is None:
+            return "queued"
+        percent = 100
+        if obj.rows_total:
+            percent = min(100, 100 * obj.rows_deleted // obj.rows_total)
+        return f"{obj.rows_deleted} / {obj.rows_total} rows ({percent}%)"
+
+
+@admin.register(ProfilerCapture)
+class ProfilerCaptureAdmin(admin.ModelAdmin):
+    list_display = (
+        "id",
+        "created_at",
+        "user",
+        "method",
+        "path",
+        "status_code",
+        "duration_ms",
+        "sample_count",
+        "download",
+    )
+    list_select_related = ("user",)
+    exclude = ("data",)
+    ordering = ("-id",)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_urls(self):
+        return [
+            path(
+                "<int:object_id>/collapsed/",
+                self.admin_site.admin_view(self.collapsed_view),
+                name="profile_services_profilercapture_collapsed",
+            )
+        ] + super().get_urls()
+
+    def collapsed_view(self, request, object_id):
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        capture = get_object_or_404(ProfilerCapture, pk=object_id)
+        response = HttpResponse(capture.collapsed(), content_type="text/plain")
+        response[
+            "Content-Disposition"
+        ] = f'attachment; filename="profile-{capture.pk}.folded"'
+        return response
+
+    @admin.display(description="stacks")
+    def download(self, obj):
+        url = reverse("admin:profile_services_profilercapture_collapsed", args=[obj.pk])
+        return format_html('<a href="{}">collapsed</a>', url)
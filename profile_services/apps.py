@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class ProfileServicesConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "profile_services"
+
+    def ready(self):
+        # Connects the profile card invalidation signals and registers the
+        # system checks.
+        from profile_services import checks, profile_cards  # noqa: F401
@@ -0,0 +1,311 @@
+"""
+Cold storage for likes and comments of old posts.
+
+``archive_engagement`` moves the rows of posts older than
+``ENGAGEMENT_ARCHIVE_AFTER_DAYS`` into one compressed ``EngagementSegment``
+per post, kind and month. The read helpers rebuild archived rows as unsaved
+``Like``/``Comment`` instances so serializers can render them next to the
+live ones. They read ``post.engagement_segments.all()``, so prefetch
+``engagement_segments`` when rendering many posts. Replying to an archived
+comment moves its thread back to the live table first
+(``restore_archived_comment()``).
+"""
+import datetime
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Case, Q, Value, When
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from profile_services.models import Post, Like, Comment, EngagementSegment
+from profile_services.profile_cards import prime_cards
+from social_media_platform_api.snowflake import id_at
+
+LIKE_COLUMNS = ("id", "user_id", "created_at")
+COMMENT_COLUMNS = ("id", "user_id", "content", "parent_id", "path", "created_at")
+
+
+def _segments(post, kind):
+    return [
+        segment
+        for segment in sorted(
+            post.engagement_segments.all(), key=lambda segment: segment.month
+        )
+        if segment.kind == kind
+    ]
+
+
+def _archive_rows(post_id, model, kind, columns):
+    rows = list(
+        model.objects.filter(post_id=post_id).order_by("id").values_list(*columns)
+    )
+    if not rows:
+        return 0
+
+    months = {}
+    for row in rows:
+        created_at = row[-1]
+        month = datetime.date(created_at.year, created_at.month, 1)
+        months.setdefault(month, []).append(list(row[:-1]) + [created_at.isoformat()])
+
+    EngagementSegment.objects.bulk_create(
+        EngagementSegment(
+            post_id=post_id,
+            kind=kind,
+            month=month,
+            row_count=len(month_rows),
+            data=EngagementSegment.pack(month_rows),
+        )
+        for month, month_rows in months.items()
+    )
+    model.objects.filter(id__in=[row[0] for row in rows]).delete()
+    return len(rows)
+
+
+def archive_engagement(older_than_days=None, batch_size=500):
+    """
+    Archive likes and comments of every post created more than
+    ``older_than_days`` ago. Each post is moved in its own transaction, so
+    the job can be interrupted and rerun. Returns ``(likes, comments)``.
+    """
+    if older_than_days is None:
+        older_than_days = settings.ENGAGEMENT_ARCHIVE_AFTER_DAYS
+    cutoff = timezone.now() - datetime.timedelta(days=older_than_days)
+
+    archived_likes = archived_comments = 0
+    last_id = 0
+    while True:
+        post_ids = list(
+            # Ids are time-ordered, so the id bound keeps the walk among old
+            # posts; created_at still decides for posts with pre-snowflake ids.
+            Post.objects.filter(
+                created_at__lt=cutoff, id__gt=last_id, id__lt=id_at(cutoff)
+            )
+            .filter(Q(likes__isnull=False) | Q(comments__isnull=False))
+            .order_by("id")
+            .values_list("id", flat=True)
+            .distinct()[:batch_size]
+        )
+        if not post_ids:
+            return archived_likes, archived_comments
+
+        for post_id in post_ids:
+            with transaction.atomic():
+                archived_likes += _archive_rows(
+                    post_id, Like, EngagementSegment.LIKES, LIKE_COLUMNS
+                )
+                archived_comments += _archive_rows(
+                    post_id, Comment, EngagementSegment.COMMENTS, COMMENT_COLUMNS
+                )
+        last_id = post_ids[-1]
+
+
+def _users(rows):
+    user_ids = {row[1] for row in rows}
+    return get_user_model().objects.in_bulk(user_ids) if user_ids else {}
+
+
+def like_segments(post):
+    return _segments(post, EngagementSegment.LIKES)
+
+
+def archived_like_count(post):
+    return sum(segment.row_count for segment in like_segments(post))
+
+
+def first_archived_likers(segments, request=None):
+    """
+    Map each post id in ``segments`` (``{post id: like segments, oldest
+    first}``) to the user id of its oldest archived like by a user that
+    still exists, leaving out posts without one. Segments are read a month
+    at a time for all posts together, so this usually decompresses one
+    segment per post and loads the cards once.
+    """
+    pending = {
+        post_id: iter(post_segments) for post_id, post_segments in segments.items()
+    }
+    first = {}
+    while pending:
+        rows = {}
+        for post_id, post_segments in list(pending.items()):
+            segment = next(post_segments, None)
+            if segment is None:
+                del pending[post_id]
+            else:
+                rows[post_id] = segment.rows()
+        cards = prime_cards(
+            request, {row[1] for post_rows in rows.values() for row in post_rows}
+        )
+        for post_id, post_rows in rows.items():
+            user_id = next((row[1] for row in post_rows if row[1] in cards), None)
+            if user_id is not None:
+                first[post_id] = user_id
+                del pending[post_id]
+    return first
+
+
+def archived_likes(post):
+    rows = [
+        row
+        for segment in _segments(post, EngagementSegment.LIKES)
+        for row in segment.rows()
+    ]
+    users = _users(rows)
+    return [
+        Like(
+            id=like_id,
+            user=users[user_id],
+            post=post,
+            created_at=parse_datetime(created_at),
+        )
+        for like_id, user_id, created_at in rows
+        if user_id in users
+    ]
+
+
+def _comment_columns(row):
+    # Comments archived before replies existed are top-level.
+    if len(row) == 4:
+        comment_id, user_id, content, created_at = row
+        path = Comment.path_step(comment_id)
+        return [comment_id, user_id, content, None, path, created_at]
+    return row
+
+
+def archived_comments(post):
+    rows = [
+        _comment_columns(row)
+        for segment in _segments(post, EngagementSegment.COMMENTS)
+        for row in segment.rows()
+    ]
+    users = _users(rows)
+    return [
+        Comment(
+            id=comment_id,
+            user=users[user_id],
+            post=post,
+            content=content,
+            parent_id=parent_id,
+            path=path,
+            created_at=parse_datetime(created_at),
+        )
+        for comment_id, user_id, content, parent_id, path, created_at in rows
+        if user_id in users
+    ]
+
+
+def has_archived_like(post, user_id):
+    return any(
+        row[1] == user_id
+        for segment in _segments(post, EngagementSegment.LIKES)
+        for row in segment.rows()
+    )
+
+
+def archived_liked_post_ids(post_ids, user_id):
+    """
+    The ids among ``post_ids`` of the posts with an archived like by
+    ``user_id``.
+    """
+    return {
+        segment.post_id
+        for segment in EngagementSegment.objects.filter(
+            post_id__in=post_ids, kind=EngagementSegment.LIKES
+        )
+        if any(row[1] == user_id for row in segment.rows())
+    }
+
+
+def _drop_rows(segment, drop):
+    """
+    Rewrite ``segment`` without the rows for which ``drop(row)`` is true,
+    deleting it when none are left. Returns whether it had any.
+    """
+    rows = segment.rows()
+    kept = [row for row in rows if not drop(row)]
+    if len(kept) == len(rows):
+        return False
+    if kept:
+        segment.data = EngagementSegment.pack(kept)
+        segment.row_count = len(kept)
+        segment.save(update_fields=["data", "row_count"])
+    else:
+        segment.delete()
+    return True
+
+
+def drop_user_rows(segment, user_id):
+    """
+    Rewrite ``segment`` without ``user_id``'s rows, deleting it when none
+    are left. Returns whether it had any.
+    """
+    return _drop_rows(segment, lambda row: row[1] == user_id)
+
+
+def restore_archived_comment(post, comment_id):
+    """
+    Move the archived comment ``comment_id`` of ``post`` back to the live
+    table with its archived ancestors, so that it can be replied to.
+    Returns the comment, or ``None`` when there is no such archived comment
+    or one of its ancestors is gone.
+    """
+    with transaction.atomic():
+        segments = list(
+            EngagementSegment.objects.select_for_update().filter(
+                post=post, kind=EngagementSegment.COMMENTS
+            )
+        )
+        rows = {
+            row[0]: row
+            for segment in segments
+            for row in map(_comment_columns, segment.rows())
+        }
+        if comment_id not in rows:
+            return None
+        path = rows[comment_id][4]
+        thread = {
+            int(path[i : i + Comment.PATH_STEP], 16)
+            for i in range(0, len(path), Comment.PATH_STEP)
+        }
+        live = thread - rows.keys()
+        if live and Comment.all_objects.filter(pk__in=live).count() != len(live):
+            return None
+
+        restored = [rows[pk] for pk in sorted(thread & rows.keys())]
+        comments = Comment.objects.bulk_create(
+            Comment(
+                id=pk,
+                user_id=user_id,
+                post=post,
+                content=content,
+                parent_id=parent_id,
+                path=comment_path,
+            )
+            for pk, user_id, content, parent_id, comment_path, _ in restored
+        )
+        # bulk_create() stamps created_at with the current time.
+        created = {row[0]: parse_datetime(row[5]) for row in restored}
+        Comment.all_objects.filter(pk__in=created).update(
+            created_at=Case(
+                *(When(pk=pk, then=Value(at)) for pk, at in created.items())
+            )
+        )
+        for comment in comments:
+            comment.created_at = created[comment.pk]
+        for segment in segments:
+            _drop_rows(segment, lambda row: row[0] in thread)
+        return next(comment for comment in comments if comment.pk == comment_id)
+
+
+def remove_archived_like(post, user_id):
+    """
+    Drop ``user_id``'s archived like of ``post``. Returns whether one was
+    found.
+    """
+    with transaction.atomic():
+        segments = EngagementSegment.objects.select_for_update().filter(
+            post=post, kind=EngagementSegment.LIKES
+        )
+        return any(drop_user_rows(segment, user_id) for segment in segments)
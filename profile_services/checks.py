@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.core import checks
+
+from social_media_platform_api.caches import is_shared
+
+
+@checks.register(checks.Tags.caches, deploy=True)
+def check_profile_card_cache(app_configs, **kwargs):
+    # Cards are dropped from the cache of the process that changed them.
+    if is_shared(settings.PROFILE_CARD_CACHE):
+        return []
+    return [
+        checks.Warning(
+            "PROFILE_CARD_CACHE is local to each process, so the other "
+            "processes serve changed usernames, avatars and counts for up to "
+            "PROFILE_CARD_TIMEOUT seconds.",
+            hint="Set REDIS_URL.",
+            id="profile_services.W001",
+        )
+    ]
@@ -0,0 +1,209 @@
+"""
+Soft deletion of users, profiles and posts.
+
+``delete_user()``, ``delete_profile()`` and ``delete_post()`` only mark the
+rows (``deleted_at``, and ``is_active = False`` for users), which hides them
+at once, a deleted user's likes and comments included, and queue a
+``DeletionJob``. ``reap()`` (``manage.py reap_deletions``) then deletes the
+dependent rows of the oldest job one bounded batch at a time, each batch in
+its own short transaction, and the marked object last. The job records the
+current step and the rows deleted so far for the admin.
+
+A user's archived likes and comments on other users' posts sit inside
+compressed segments, which no query can pick out. That step reads every
+such segment, a batch at a time from ``job.cursor``, and rewrites the ones
+holding the user's rows.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from profile_services.archive import drop_user_rows
+from profile_services.models import (
+    Comment,
+    DeletionJob,
+    EngagementSegment,
+    Like,
+    Post,
+    Profile,
+)
+from profile_services.profile_cards import invalidate_cards
+
+
+def _purge_archived_rows(job, segments, batch_size):
+    batch = list(
+        segments.select_for_update()
+        .filter(pk__gt=job.cursor)
+        .order_by("pk")[:batch_size]
+    )
+    if batch:
+        job.cursor = batch[-1].pk
+    for segment in batch:
+        drop_user_rows(segment, job.object_id)
+    return len(batch)
+
+
+# (name, rows) per job kind, in deletion order: dependents first. The steps
+# don't overlap, so their counts add up to the job's total. A third item
+# replaces deleting ``rows`` with ``(job, rows, batch_size) -> rows handled``.
+STEPS = {
+    DeletionJob.POST: (
+        ("likes", lambda pk: Like.all_objects.filter(post_id=pk)),
+        ("comments", lambda pk: Comment.all_objects.filter(post_id=pk)),
+        (
+            "archived engagement",
+            lambda pk: EngagementSegment.objects.filter(post_id=pk),
+        ),
+        ("tags", lambda pk: Post.tags.through.objects.filter(post_id=pk)),
+        ("post", lambda pk: Post.all_objects.filter(pk=pk)),
+    ),
+    DeletionJob.PROFILE: (
+        ("likes", lambda pk: Like.all_objects.filter(post__profile_id=pk)),
+        ("comments", lambda pk: Comment.all_objects.filter(post__profile_id=pk)),
+        (
+            "archived engagement",
+            lambda pk: EngagementSegment.objects.filter(post__profile_id=pk),
+        ),
+        (
+            "post tags",
+            lambda pk: Post.tags.through.objects.filter(post__profile_id=pk),
+        ),
+        ("posts", lambda pk: Post.all_objects.filter(profile_id=pk)),
+        (
+            "followers",
+            lambda pk: Profile.followers.through.objects.filter(profile_id=pk),
+        ),
+        (
+            "following",
+            lambda pk: Profile.following.through.objects.filter(profile_id=pk),
+        ),
+        ("profile", lambda pk: Profile.all_objects.filter(pk=pk)),
+    ),
+    DeletionJob.USER: (
+        ("likes", lambda pk: Like.all_objects.filter(user_id=pk)),
+        ("comments", lambda pk: Comment.all_objects.filter(user_id=pk)),
+        (
+            "likes on posts",
+            lambda pk: Like.all_objects.filter(post__user_id=pk).exclude(user_id=pk),
+        ),
+        (
+            "comments on posts",
+            lambda pk: Comment.all_objects.filter(post__user_id=pk).exclude(user_id=pk),
+        ),
+        (
+            "archived likes and comments",
+            lambda pk: EngagementSegment.objects.exclude(post__user_id=pk),
+            _purge_archived_rows,
+        ),
+        (
+            "archived engagement",
+            lambda pk: EngagementSegment.objects.filter(post__user_id=pk),
+        ),
+        ("post tags", lambda pk: Post.tags.through.objects.filter(post__user_id=pk)),
+        ("posts", lambda pk: Post.all_objects.filter(user_id=pk)),
+        (
+            "followers",
+            lambda pk: Profile.followers.through.objects.filter(
+                Q(user_id=pk) | Q(profile__user_id=pk)
+            ),
+        ),
+        (
+            "following",
+            lambda pk: Profile.following.through.objects.filter(
+                Q(user_id=pk) | Q(profile__user_id=pk)
+            ),
+        ),
+        ("user", lambda pk: get_user_model().objects.filter(pk=pk)),
+    ),
+}
+
+
+def step_name(job):
+    steps = STEPS[job.kind]
+    if job.step >= len(steps):
+        return "done"
+    return steps[job.step][0]
+
+
+def delete_post(post):
+    with transaction.atomic():
+        Post.all_objects.filter(pk=post.pk).update(deleted_at=timezone.now())
+        DeletionJob.objects.create(kind=DeletionJob.POST, object_id=post.pk)
+        invalidate_cards([post.user_id])
+
+
+def delete_profile(profile):
+    if profile.deleted_at is not None:
+        return
+    now = timezone.now()
+    with transaction.atomic():
+        Profile.all_objects.filter(pk=profile.pk).update(deleted_at=now)
+        Post.all_objects.filter(profile_id=profile.pk, deleted_at__isnull=True).update(
+            deleted_at=now
+        )
+        DeletionJob.objects.create(kind=DeletionJob.PROFILE, object_id=profile.pk)
+        invalidate_cards([profile.user_id])
+
+
+def delete_user(user):
+    if user.deleted_at is not None:
+        return
+    now = timezone.now()
+    with transaction.atomic():
+        get_user_model().objects.filter(pk=user.pk).update(
+            deleted_at=now, is_active=False
+        )
+        Profile.all_objects.filter(user_id=user.pk).update(deleted_at=now)
+        Post.all_objects.filter(user_id=user.pk, deleted_at__isnull=True).update(
+            deleted_at=now
+        )
+        DeletionJob.objects.create(kind=DeletionJob.USER, object_id=user.pk)
+        invalidate_cards([user.pk])
+
+
+def _delete_batch(rows, batch_size):
+    pks = list(rows.order_by().values_list("pk", flat=True)[:batch_size])
+    if pks:
+        rows.model._base_manager.filter(pk__in=pks).delete()
+    return len(pks)
+
+
+def reap(batch_size=None):
+    """
+    Delete one batch for the oldest unfinished job. Returns the job, or
+    ``None`` when there is nothing left to delete.
+    """
+    batch_size = batch_size or settings.DELETION_BATCH_SIZE
+
+    with transaction.atomic():
+        queryset = DeletionJob.objects.filter(finished_at__isnull=True).order_by("id")
+        if connection.features.has_select_for_update_skip_locked:
+            # Lets several reapers work on different jobs.
+            queryset = queryset.select_for_update(skip_locked=True)
+        job = queryset.first()
+        if job is None:
+            return None
+
+        steps = STEPS[job.kind]
+        if job.rows_total is None:
+            job.rows_total = sum(
+                step[1](job.object_id).count() for step in steps[job.step :]
+            )
+
+        while job.step < len(steps):
+            _, rows, *handle = steps[job.step]
+            rows = rows(job.object_id)
+            if handle:
+                deleted = handle[0](job, rows, batch_size)
+            else:
+                deleted = _delete_batch(rows, batch_size)
+            if deleted:
+                job.rows_deleted += deleted
+                break
+            job.step += 1
+        else:
+            job.finished_at = timezone.now()
+        job.save()
+    return job
@@ -0,0 +1,159 @@
+"""
+Read-only fast path for the list endpoints.
+
+Builds the same dicts as ``PostListSerializer`` and ``ProfileListSerializer``
+straight from ``values()`` rows, without instantiating models or running the
+serializer field machinery. Keep the keys and their order in sync with the
+serializers: the rendered bytes must match the regular path exactly.
+"""
+from operator import attrgetter
+
+from django.db.models import Count, Min
+from rest_framework import serializers
+
+from profile_services.archive import first_archived_likers
+from profile_services.models import Profile, Post, Like, Tag, EngagementSegment
+from profile_services.profile_cards import prime_cards
+from profile_services.viewer_flags import prime_followed, prime_liked
+
+_datetime_field = serializers.DateTimeField()
+
+
+def _file_url(field, name, request):
+    if not name:
+        return None
+    url = field.storage.url(name)
+    if request is not None:
+        return request.build_absolute_uri(url)
+    return url
+
+
+def _values(queryset, fields):
+    if not isinstance(queryset, list):
+        return list(queryset.values(*fields))
+
+    # A paginated page of model instances: refetch as dicts, keep the order.
+    if not queryset:
+        return []
+    model = type(queryset[0])
+    ids = [obj.pk for obj in queryset]
+    rows = {row["id"]: row for row in model.objects.filter(pk__in=ids).values(*fields)}
+    return [rows[pk] for pk in ids if pk in rows]
+
+
+def _username(cards, user_id):
+    card = cards.get(user_id)
+    return card["username"] if card else None
+
+
+def _merge_archived_likes(ids, likes, first_like_users, request):
+    """
+    Fold archived like counts into ``likes``. Archived likes predate the
+    live ones, so a post's first like is its oldest archived like by a user
+    that still exists, or else its first live like. Returns the ids of the
+    posts with archived likes.
+    """
+    segments = {}
+    for segment in EngagementSegment.objects.filter(
+        post_id__in=ids, kind=EngagementSegment.LIKES
+    ):
+        segments.setdefault(segment.post_id, []).append(segment)
+    for post_segments in segments.values():
+        post_segments.sort(key=attrgetter("month"))
+
+    first_user_ids = first_archived_likers(segments, request)
+    for post_id, post_segments in segments.items():
+        live_count, key = likes.get(post_id, (0, None))
+        if post_id in first_user_ids:
+            key = ("archived", post_id)
+            first_like_users[key] = first_user_ids[post_id]
+        archived_count = sum(segment.row_count for segment in post_segments)
+        likes[post_id] = (live_count + archived_count, key)
+    return segments.keys()
+
+
+def post_list_rows(queryset, request=None):
+    image_field = Post._meta.get_field("post_image")
+    rows = _values(
+        queryset,
+        ("id", "user_id", "post_image", "post_description", "created_at"),
+    )
+    ids = {row["id"] for row in rows}
+
+    tags = {}
+    likes = {}
+    first_like_users = {}
+    archived = ()
+    if ids:
+        for post_id, name in Tag.objects.filter(post__in=ids).values_list(
+            "post", "name"
+        ):
+            tags.setdefault(post_id, []).append(name)
+
+        for row in (
+            Like.objects.filter(post_id__in=ids)
+            .values("post_id")
+            .annotate(count=Count("id"), first_id=Min("id"))
+            .order_by()
+        ):
+            likes[row["post_id"]] = (row["count"], row["first_id"])
+
+        first_like_users = dict(
+            Like.objects.filter(
+                id__in=[first_id for _, first_id in likes.values()]
+            ).values_list("id", "user_id")
+        )
+        archived = _merge_archived_likes(ids, likes, first_like_users, request)
+
+    cards = prime_cards(
+        request, {row["user_id"] for row in rows} | set(first_like_users.values())
+    )
+    liked = prime_liked(request, ids, archived)
+
+    data = []
+    for row in rows:
+        count, first_id = likes.get(row["id"], (0, None))
+        first_user_id = first_like_users.get(first_id)
+        if count >= 2:
+            post_likes = (
+                f"Like by {_username(cards, first_user_id)} "
+                f"and {count - 1} other users"
+            )
+        elif first_user_id is not None:
+            post_likes = [{"user": _username(cards, first_user_id)}]
+        else:
+            # No like, or only an archived one by a deleted user.
+            post_likes = []
+
+        data.append(
+            {
+                "id": str(row["id"]),
+                "user": _username(cards, row["user_id"]),
+                "post_image": _file_url(image_field, row["post_image"], request),
+                "post_description": row["post_description"],
+                "tags": tags.get(row["id"], []),
+                "likes": post_likes,
+                "liked_by_me": row["id"] in liked,
+                "created_at": _datetime_field.to_representation(row["created_at"]),
+            }
+        )
+    return data
+
+
+def profile_list_rows(queryset, request=None):
+    picture_field = Profile._meta.get_field("profile_picture")
+    rows = _values(queryset, ("id", "user_id", "profile_picture", "bio"))
+    cards = prime_cards(request, {row["user_id"] for row in rows})
+    followed = prime_followed(request, {row["id"] for row in rows})
+    return [
+        {
+            "id": row["id"],
+            "user": _username(cards, row["user_id"]),
+            "profile_picture": _file_url(
+                picture_field, row["profile_picture"], request
+            ),
+            "bio": row["bio"],
+            "followed_by_me": row["id"] in followed,
+        }
+        for row in rows
+    ]
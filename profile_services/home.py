@@ -0,0 +1,167 @@
+"""
+The home screen in one round trip: the viewer's account and profile, the
+first page of their feed, unread counters and trending tags.
+
+The parts don't depend on each other. With ``HOME_SCREEN_WORKERS`` they
+load concurrently on a shared thread pool; each pool thread keeps its own
+database connection open from one request to the next, so the process
+holds at most that many extra connections. Otherwise the parts load one
+after another in the request thread. What
+several parts need (the viewer's profile and profile card) is loaded
+once, before the parts start, into the request's identity map.
+
+The counters count what arrived since ``Profile.last_seen_at``, which the
+request then moves to now. They stop at ``HOME_COUNTER_LIMIT``.
+"""
+import datetime
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.db.models import Count
+from django.utils import timezone
+
+from profile_services.fast_path import post_list_rows
+from profile_services.identity_map import get_request_profile
+from profile_services.models import Comment, Like, Post, Profile
+from profile_services.profile_cards import prime_cards
+from profile_services.serializers import PostListSerializer, ProfileSummarySerializer
+from social_media_platform_api.snowflake import id_at
+from user.serializers import UserSerializer
+
+TRENDING_TAGS_KEY = "trending-tags"
+
+_executor = None
+_executor_pid = None
+
+
+def _get_executor():
+    global _executor, _executor_pid
+    # Threads don't survive a fork; a forked worker starts its own pool.
+    if _executor_pid != os.getpid():
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.HOME_SCREEN_WORKERS, thread_name_prefix="home"
+        )
+        _executor_pid = os.getpid()
+    return _executor
+
+
+def _in_worker(part, *args):
+    # Connections are per thread and pool threads live as long as the
+    # process: keep them, unless a query failed and left one unusable.
+    for conn in connections.all():
+        if conn.connection is not None and conn.errors_occurred:
+            if conn.is_usable():
+                conn.errors_occurred = False
+            else:
+                conn.close()
+    return part(*args)
+
+
+def _following(profile):
+    return Profile.following.through.objects.filter(profile_id=profile.pk).values(
+        "user_id"
+    )
+
+
+def profile_part(request, profile):
+    summary = None
+    if profile is not None:
+        summary = ProfileSummarySerializer(profile, context={"request": request}).data
+    return {"user": UserSerializer(request.user).data, "profile": summary}
+
+
+def feed_part(request, profile):
+    if profile is None:
+        return []
+    posts = Post.objects.filter(user_id__in=_following(profile)).order_by("-id")
+    size = settings.HOME_FEED_PAGE_SIZE
+    if getattr(settings, "FAST_LIST_SERIALIZATION", False):
+        return post_list_rows(posts.only("id")[:size], request)
+    posts = posts.prefetch_related("tags", "engagement_segments", "likes")[:size]
+    return PostListSerializer(posts, many=True, context={"request": request}).data
+
+
+def _count(queryset):
+    return queryset[: settings.HOME_COUNTER_LIMIT].count()
+
+
+def counters_part(request, profile):
+    if profile is None or profile.last_seen_at is None:
+        return {"feed": 0, "likes": 0, "comments": 0}
+    # Snowflake ids are time-ordered: "since" is a primary-key range.
+    since = id_at(profile.last_seen_at)
+    user_id = request.user.pk
+    return {
+        "feed": _count(
+            Post.objects.filter(user_id__in=_following(profile), id__gte=since)
+        ),
+        "likes": _count(
+            Like.objects.filter(post__user_id=user_id, id__gte=since).exclude(
+                user_id=user_id
+            )
+        ),
+        "comments": _count(
+            Comment.objects.filter(post__user_id=user_id, id__gte=since).exclude(
+                user_id=user_id
+            )
+        ),
+    }
+
+
+def trending_tags():
+    """
+    The tags of the most recent posts, most used first; the same for
+    everyone, so cached for ``TRENDING_TAGS_TIMEOUT`` seconds.
+    """
+    tags = cache.get(TRENDING_TAGS_KEY)
+    if tags is None:
+        since = timezone.now() - datetime.timedelta(hours=settings.TRENDING_TAGS_HOURS)
+        tags = list(
+            Post.tags.through.objects.filter(
+                post_id__gte=id_at(since), post__deleted_at__isnull=True
+            )
+            .values("tag__name")
+            .annotate(posts=Count("post_id"))
+            .order_by("-posts", "tag__name")
+            .values_list("tag__name", "posts")[: settings.TRENDING_TAGS_LIMIT]
+        )
+        tags = [{"name": name, "posts": posts} for name, posts in tags]
+        cache.set(TRENDING_TAGS_KEY, tags, settings.TRENDING_TAGS_TIMEOUT)
+    return tags
+
+
+def trending_part(request, profile):
+    return trending_tags()
+
+
+PARTS = {
+    "me": profile_part,
+    "feed": feed_part,
+    "counters": counters_part,
+    "trending_tags": trending_part,
+}
+
+
+def home_screen(request):
+    try:
+        profile = get_request_profile(request)
+    except Profile.DoesNotExist:
+        profile = None
+    prime_cards(request, [request.user.pk])
+
+    if settings.HOME_SCREEN_WORKERS:
+        executor = _get_executor()
+        futures = {
+            name: executor.submit(_in_worker, part, request, profile)
+            for name, part in PARTS.items()
+        }
+        data = {name: future.result() for name, future in futures.items()}
+    else:
+        data = {name: part(request, profile) for name, part in PARTS.items()}
+
+    if profile is not None:
+        Profile.objects.filter(pk=profile.pk).update(last_seen_at=timezone.now())
+    return data
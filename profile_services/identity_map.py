@@ -0,0 +1,89 @@
+"""
+Request-scoped identity map.
+
+Views, permissions and serializers all ask for the same handful of rows
+while handling one request (the object behind ``get_object()`` and the
+requesting user's profile). The map lives on the underlying Django
+request, so every DRF ``Request`` wrapping it shares the same cache, and
+it is dropped together with the request.
+"""
+from contextlib import contextmanager
+
+from profile_services.models import Profile
+
+_ATTRIBUTE = "_identity_map"
+
+
+class IdentityMap:
+    def __init__(self):
+        self._objects = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, loader):
+        try:
+            obj = self._objects[key]
+        except KeyError:
+            self.misses += 1
+            obj = self._objects[key] = loader()
+            return obj
+        self.hits += 1
+        return obj
+
+    def add(self, key, obj):
+        self._objects[key] = obj
+
+    def find(self, key, default=None):
+        return self._objects.get(key, default)
+
+    @contextmanager
+    def scope(self):
+        """
+        Forget what is added inside the block, so a streamed list holds one
+        chunk's cards and flags at a time.
+        """
+        keys = set(self._objects)
+        try:
+            yield self
+        finally:
+            for key in set(self._objects) - keys:
+                del self._objects[key]
+
+
+def get_identity_map(request):
+    request = getattr(request, "_request", request)
+    identity_map = getattr(request, _ATTRIBUTE, None)
+    if identity_map is None:
+        identity_map = IdentityMap()
+        setattr(request, _ATTRIBUTE, identity_map)
+    return identity_map
+
+
+def object_key(model, pk):
+    return (model._meta.label_lower, str(pk))
+
+
+def remember(request, obj):
+    identity_map = get_identity_map(request)
+    identity_map.add(object_key(type(obj), obj.pk), obj)
+    if isinstance(obj, Profile):
+        identity_map.add(("profile_of", obj.user_id), obj)
+
+
+def get_request_profile(request):
+    """
+    Return ``request.user.profile``, loading it at most once per request.
+    """
+    user = request.user
+    identity_map = get_identity_map(request)
+
+    def load():
+        profile = Profile.objects.get(user=user)
+        identity_map.add(object_key(Profile, profile.pk), profile)
+        return profile
+
+    profile = identity_map.get(("profile_of", user.pk), load)
+    # Let plain ``user.profile`` / ``profile.user`` lookups hit the cache too.
+    Profile._meta.get_field("user").remote_field.set_cached_value(user, profile)
+    Profile._meta.get_field("user").set_cached_value(profile, user)
+    return profile
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from profile_services.archive import archive_engagement
+
+
+class Command(BaseCommand):
+    help = (
+        "Move likes and comments of old posts into compressed monthly "
+        "segments. Safe to interrupt and rerun."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=None,
+            help="Archive posts older than this many days "
+            "(default: ENGAGEMENT_ARCHIVE_AFTER_DAYS).",
+        )
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        likes, comments = archive_engagement(
+            older_than_days=options["days"], batch_size=options["batch_size"]
+        )
+        self.stdout.write(f"Archived {likes} likes and {comments} comments.")
@@ -0,0 +1,123 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from profile_services.fast_path import post_list_rows, profile_list_rows
+from profile_services.models import Profile, Post, Like, Tag
+from profile_services.serializers import PostListSerializer, ProfileListSerializer
+from profile_services.views import PostViewSet, ProfileViewSet
+from social_media_platform_api.renderers import ORJSONRenderer
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the serializer and values() list paths on a seeded dataset. "
+        "Everything runs inside a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=200)
+        parser.add_argument("--posts-per-user", type=int, default=10)
+        parser.add_argument("--likes-per-post", type=int, default=5)
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.seed(options)
+                self.run(options["repeat"])
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def seed(self, options):
+        User = get_user_model()
+        User.objects.bulk_create(
+            User(username=f"bench-{i}", email=f"bench-{i}@example.com")
+            for i in range(options["users"])
+        )
+        users = list(User.objects.filter(username__startswith="bench-"))
+        Profile.objects.bulk_create(
+            Profile(user=user, bio=f"Bio of {user.username}") for user in users
+        )
+        profiles = {p.user_id: p for p in Profile.objects.filter(user__in=users)}
+        Post.objects.bulk_create(
+            Post(
+                user=user,
+                profile=profiles[user.id],
+                post_image=f"post_images/{user.username}-{i}.jpg",
+                post_description=f"Post {i} by {user.username}",
+            )
+            for user in users
+            for i in range(options["posts_per_user"])
+        )
+        posts = list(Post.objects.filter(user__in=users))
+        Tag.objects.bulk_create(Tag(name=f"bench-tag-{i}") for i in range(20))
+        tags = list(Tag.objects.filter(name__startswith="bench-tag-"))
+        Post.tags.through.objects.bulk_create(
+            Post.tags.through(post_id=post.id, tag_id=tags[post.id % len(tags)].id)
+            for post in posts
+        )
+        Like.objects.bulk_create(
+            Like(post=post, user=users[(post.id + i) % len(users)])
+            for post in posts
+            for i in range(options["likes_per_post"])
+        )
+
+    def run(self, repeat):
+        factory = APIRequestFactory()
+        cases = (
+            (PostViewSet, PostListSerializer, post_list_rows, "/api/post/"),
+            (ProfileViewSet, ProfileListSerializer, profile_list_rows, "/api/profile/"),
+        )
+        for viewset, serializer_class, build, path in cases:
+
+            def get_request():
+                # A fresh request each run: cards and viewer flags are
+                # remembered per request.
+                return Request(factory.get(path, HTTP_HOST="localhost"))
+
+            # What the list action loads, prefetches included.
+            view = viewset(
+                action="list", request=get_request(), format_kwarg=None, kwargs={}
+            )
+            queryset = view.get_queryset()
+
+            def serializer_path():
+                data = serializer_class(
+                    queryset.all(), many=True, context={"request": get_request()}
+                ).data
+                return JSONRenderer().render(data)
+
+            def fast_path():
+                return ORJSONRenderer().render(build(queryset.all(), get_request()))
+
+            if serializer_path() != fast_path():
+                raise CommandError(f"{viewset.__name__}: fast path output differs")
+
+            slow = self.best_of(serializer_path, repeat)
+            fast = self.best_of(fast_path, repeat)
+            self.stdout.write(
+                f"{viewset.__name__}.list ({queryset.count()} rows): "
+                f"serializer {slow * 1000:.1f} ms, "
+                f"values() + orjson {fast * 1000:.1f} ms, "
+                f"{slow / fast:.1f}x"
+            )
+
+    @staticmethod
+    def best_of(func, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+        return min(timings)
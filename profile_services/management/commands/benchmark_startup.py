@@ -0,0 +1,120 @@
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+PATHS = (
+    "/api/profile_services/post/",
+    "/api/profile_services/profile/",
+    "/api/schema/",
+)
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _memory_kb(pid):
+    """
+    ``(rss, pss)`` of a process in kB. PSS splits shared pages between the
+    processes sharing them, so it shows what copy-on-write saves.
+    """
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as smaps:
+        for line in smaps:
+            name, _, rest = line.partition(":")
+            if name in ("Rss", "Pss"):
+                values[name] = int(rest.split()[0])
+    return values["Rss"], values["Pss"]
+
+
+def _workers(master_pid):
+    with open(f"/proc/{master_pid}/task/{master_pid}/children") as children:
+        return [int(pid) for pid in children.read().split()]
+
+
+class Command(BaseCommand):
+    help = (
+        "Start gunicorn with and without preload + warm-up and report the time "
+        "to the first response of each endpoint and per-worker memory. Linux "
+        "only; uses the configured database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=4)
+        parser.add_argument("--timeout", type=float, default=60)
+
+    def handle(self, *args, **options):
+        if not os.path.exists("/proc/self/smaps_rollup"):
+            raise CommandError("benchmark_startup needs Linux /proc.")
+
+        for preload in (False, True):
+            self.run(preload, options["workers"], options["timeout"])
+
+    def run(self, preload, workers, timeout):
+        port = _free_port()
+        env = {
+            **os.environ,
+            "GUNICORN_BIND": f"127.0.0.1:{port}",
+            "GUNICORN_PRELOAD": "1" if preload else "0",
+            "WEB_CONCURRENCY": str(workers),
+            "SNOWFLAKE_WORKER_ID": os.environ.get("SNOWFLAKE_WORKER_ID", "0"),
+        }
+        config = os.path.join(settings.BASE_DIR, "gunicorn.conf.py")
+        started = time.perf_counter()
+        server = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "-c", config],
+            cwd=settings.BASE_DIR,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            timings = self.first_responses(port, started, timeout)
+            time.sleep(1)
+            memory = [_memory_kb(pid) for pid in _workers(server.pid)]
+        finally:
+            server.terminate()
+            server.wait()
+
+        label = "preload + warm-up" if preload else "cold workers"
+        self.stdout.write(f"{label} ({workers} workers):")
+        for path, (since_start, latency) in timings.items():
+            self.stdout.write(
+                f"  {path}: first response {since_start:.2f} s after start, "
+                f"{latency * 1000:.1f} ms request"
+            )
+        if memory:
+            rss = sum(m[0] for m in memory) / len(memory)
+            pss = sum(m[1] for m in memory) / len(memory)
+            self.stdout.write(
+                f"  per worker: RSS {rss / 1024:.1f} MB, PSS {pss / 1024:.1f} MB"
+            )
+
+    def first_responses(self, port, started, timeout):
+        timings = {}
+        for path in PATHS:
+            url = f"http://127.0.0.1:{port}{path}"
+            while True:
+                if time.perf_counter() - started > timeout:
+                    raise CommandError(f"gunicorn did not answer {path} in time")
+                request_started = time.perf_counter()
+                try:
+                    urllib.request.urlopen(url, timeout=timeout).read()
+                except urllib.error.HTTPError:
+                    pass
+                except (urllib.error.URLError, ConnectionError):
+                    time.sleep(0.05)
+                    continue
+                now = time.perf_counter()
+                timings[path] = (now - started, now - request_started)
+                break
+        return timings
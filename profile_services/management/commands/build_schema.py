@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from social_media_platform_api.schema import code_version, prerender_schema
+
+
+class Command(BaseCommand):
+    help = (
+        "Render the OpenAPI schema into SCHEMA_CACHE_DIR for the current code "
+        "version, so /api/schema/ never has to generate it at request time."
+    )
+
+    def handle(self, *args, **options):
+        if not getattr(settings, "SCHEMA_CACHE_DIR", None):
+            raise CommandError("SCHEMA_CACHE_DIR is not set.")
+
+        prerender_schema()
+        self.stdout.write(
+            f"Schema for code version {code_version()} written to "
+            f"{settings.SCHEMA_CACHE_DIR}."
+        )
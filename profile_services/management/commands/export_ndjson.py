@@ -0,0 +1,30 @@
+import sys
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from profile_services.ndjson import export_lines
+
+
+class Command(BaseCommand):
+    help = "Stream users, posts, tags, likes, comments and follows as NDJSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user", help="Email of the user to export (default: everything)."
+        )
+        parser.add_argument("--output", help="File to write to (default: stdout).")
+
+    def handle(self, *args, **options):
+        user = None
+        if options["user"]:
+            try:
+                user = get_user_model().objects.get(email=options["user"])
+            except get_user_model().DoesNotExist:
+                raise CommandError(f"No user with email {options['user']}")
+
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                output.writelines(export_lines(user))
+        else:
+            sys.stdout.writelines(export_lines(user))
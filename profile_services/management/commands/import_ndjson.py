@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from profile_services.ndjson import import_ndjson
+
+
+class Command(BaseCommand):
+    help = "Bulk-load an NDJSON export produced by export_ndjson."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--checkpoint",
+            help="File recording progress; an interrupted import resumes from it.",
+        )
+
+    def handle(self, *args, **options):
+        lines, rows = import_ndjson(
+            options["path"],
+            batch_size=options["batch_size"],
+            checkpoint_path=options["checkpoint"],
+        )
+        self.stdout.write(f"Read {lines} lines, wrote {rows} rows.")
@@ -0,0 +1,53 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from profile_services.deletion import reap, step_name
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete the rows of soft-deleted users and posts in batches. Runs "
+        "until interrupted unless --once is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=None)
+        parser.add_argument(
+            "--pause",
+            type=float,
+            default=None,
+            help="Seconds to wait between batches (default: DELETION_PAUSE_SECONDS).",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=5.0,
+            help="Seconds to wait when there is nothing to delete.",
+        )
+        parser.add_argument(
+            "--once", action="store_true", help="Finish every queued job and exit."
+        )
+
+    def handle(self, *args, **options):
+        pause = options["pause"]
+        if pause is None:
+            pause = settings.DELETION_PAUSE_SECONDS
+
+        while True:
+            job = reap(options["batch_size"])
+            if job is not None:
+                if job.finished_at:
+                    self.stdout.write(f"{job}: done, {job.rows_deleted} rows.")
+                elif options["verbosity"] > 1:
+                    self.stdout.write(
+                        f"{job}: {step_name(job)}, "
+                        f"{job.rows_deleted}/{job.rows_total} rows."
+                    )
+                # Leave room for the site's own queries between batches.
+                time.sleep(pause)
+                continue
+            if options["once"]:
+                break
+            time.sleep(options["interval"])
@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from profile_services.outbox import relay
+
+
+class Command(BaseCommand):
+    help = (
+        "Deliver queued outbox events to their handlers in batches. Runs "
+        "until interrupted unless --once is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=None)
+        parser.add_argument(
+            "--backend",
+            choices=("local", "celery"),
+            default=None,
+            help="Delivery backend (default: OUTBOX_BACKEND).",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=1.0,
+            help="Seconds to wait when there is nothing to deliver.",
+        )
+        parser.add_argument(
+            "--once", action="store_true", help="Drain the outbox and exit."
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            delivered, failed = relay(options["batch_size"], options["backend"])
+            if delivered or failed:
+                self.stdout.write(f"Delivered {delivered}, failed {failed}.")
+            if delivered:
+                continue
+            if options["once"]:
+                break
+            time.sleep(options["interval"])
@@ -0,0 +1,29 @@
+# Generated by Django 4.0.4 on 2026-10-19 12:13
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profile_services', '0009_alter_post_profile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EngagementSegment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('like', 'Likes'), ('comment', 'Comments')], max_length=10)),
+                ('month', models.DateField()),
+                ('row_count', models.PositiveIntegerField()),
+                ('data', models.BinaryField()),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='engagement_segments', to='profile_services.post')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='engagementsegment',
+            index=models.Index(fields=['post', 'kind', 'month'], name='profile_ser_post_id_1f7fc4_idx'),
+        ),
+    ]
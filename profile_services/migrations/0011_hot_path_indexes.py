@@ -0,0 +1,29 @@
+# Generated by Django 4.0.4 on 2026-10-19 12:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profile_services', '0010_engagementsegment'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'created_at'], name='profile_ser_post_id_6de87c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='like',
+            index=models.Index(fields=['post', 'user'], name='profile_ser_post_id_20853e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-created_at'], name='profile_ser_created_eb2aea_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['profile', '-created_at'], name='profile_ser_profile_1865e9_idx'),
+        ),
+    ]
@@ -0,0 +1,70 @@
+from django.db import migrations, transaction
+
+BATCH_SIZE = 1000
+
+
+def copy_links_to_foreign_key(apps, schema_editor):
+    """
+    Point Post.profile at the profile that Profile.posts links the post to.
+    Each batch commits on its own and already-fixed posts are skipped, so an
+    interrupted run can simply be started again.
+    """
+    Post = apps.get_model("profile_services", "Post")
+    Link = apps.get_model("profile_services", "Profile").posts.through
+
+    last_id = 0
+    while True:
+        batch = list(
+            Link.objects.filter(id__gt=last_id)
+            .order_by("id")
+            .values_list("id", "profile_id", "post_id")[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+        last_id = batch[-1][0]
+
+        post_ids_by_profile = {}
+        for _, profile_id, post_id in batch:
+            post_ids_by_profile.setdefault(profile_id, []).append(post_id)
+        with transaction.atomic():
+            for profile_id, post_ids in post_ids_by_profile.items():
+                Post.objects.filter(id__in=post_ids).exclude(
+                    profile_id=profile_id
+                ).update(profile_id=profile_id)
+
+
+def copy_foreign_key_to_links(apps, schema_editor):
+    Post = apps.get_model("profile_services", "Post")
+    Link = apps.get_model("profile_services", "Profile").posts.through
+
+    last_id = 0
+    while True:
+        batch = list(
+            Post.objects.filter(id__gt=last_id)
+            .order_by("id")
+            .values_list("id", "profile_id")[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+        last_id = batch[-1][0]
+
+        with transaction.atomic():
+            Link.objects.bulk_create(
+                (
+                    Link(profile_id=profile_id, post_id=post_id)
+                    for post_id, profile_id in batch
+                ),
+                ignore_conflicts=True,
+            )
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ("profile_services", "0011_hot_path_indexes"),
+    ]
+
+    operations = [
+        migrations.RunPython(copy_links_to_foreign_key, copy_foreign_key_to_links),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.0.4 on 2026-10-19 12:24
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profile_services', '0012_backfill_post_profile'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='profile',
+            name='posts',
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='profile',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='posts', to='profile_services.profile'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+from django.db import migrations
+from django.db.models import Count, Min
+
+
+def merge_duplicate_tags(apps, schema_editor):
+    """
+    Keep the oldest tag of each name and move the posts of the others onto
+    it, so Tag.name can be made unique.
+    """
+    Tag = apps.get_model("profile_services", "Tag")
+    PostTag = apps.get_model("profile_services", "Post").tags.through
+
+    duplicates = (
+        Tag.objects.values("name")
+        .annotate(keep_id=Min("id"), count=Count("id"))
+        .filter(count__gt=1)
+    )
+    for row in duplicates:
+        merged_ids = list(
+            Tag.objects.filter(name=row["name"])
+            .exclude(id=row["keep_id"])
+            .values_list("id", flat=True)
+        )
+        post_ids = PostTag.objects.filter(tag_id__in=merged_ids).values_list(
+            "post_id", flat=True
+        )
+        PostTag.objects.bulk_create(
+            (PostTag(post_id=post_id, tag_id=row["keep_id"]) for post_id in post_ids),
+            ignore_conflicts=True,
+        )
+        Tag.objects.filter(id__in=merged_ids).delete()
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("profile_services", "0014_outboxevent"),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_tags, migrations.RunPython.noop),
+    ]
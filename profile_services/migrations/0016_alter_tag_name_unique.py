@@ -0,0 +1,53 @@
+# Generated by Django 4.0.4 on 2026-10-19 12:30
+
+from django.db import migrations, models
+
+
+def normalize_tag_names(apps, schema_editor):
+    """
+    Rename every tag the way ``tagging.normalize_tag()`` names new ones
+    (lower case, no "#" or surrounding space) and merge the tags that end up
+    with the same name into the oldest, as 0015 did for exact duplicates.
+    """
+    Tag = apps.get_model("profile_services", "Tag")
+    PostTag = apps.get_model("profile_services", "Post").tags.through
+
+    groups = {}
+    for tag in Tag.objects.order_by("id").iterator():
+        name = tag.name.strip().lstrip("#").strip().lower()[:255]
+        groups.setdefault(name, []).append(tag)
+
+    for name, (keep, *merged) in groups.items():
+        if merged:
+            merged_ids = [tag.id for tag in merged]
+            post_ids = PostTag.objects.filter(tag_id__in=merged_ids).values_list(
+                "post_id", flat=True
+            )
+            PostTag.objects.bulk_create(
+                (PostTag(post_id=post_id, tag_id=keep.id) for post_id in post_ids),
+                ignore_conflicts=True,
+            )
+            Tag.objects.filter(id__in=merged_ids).delete()
+        if name and keep.name != name:
+            Tag.objects.filter(id=keep.id).update(name=name)
+
+
+class Migration(migrations.Migration):
+    # Commit the renames before adding the constraint; PostgreSQL won't
+    # alter a table with deferred foreign key checks still pending.
+    atomic = False
+
+    dependencies = [
+        ("profile_services", "0015_deduplicate_tags"),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            normalize_tag_names, migrations.RunPython.noop, atomic=True
+        ),
+        migrations.AlterField(
+            model_name="tag",
+            name="name",
+            field=models.CharField(max_length=255, unique=True),
+        ),
+    ]
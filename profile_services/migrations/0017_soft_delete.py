@@ -0,0 +1,40 @@
+# Generated by Django 4.0.4 on 2026-10-19 12:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profile_services', '0016_alter_tag_name_unique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeletionJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('user', 'User'), ('post', 'Post')], max_length=10)),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('step', models.PositiveSmallIntegerField(default=0)),
+                ('rows_total', models.PositiveBigIntegerField(blank=True, null=True)),
+                ('rows_deleted', models.PositiveBigIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='deletionjob',
+            index=models.Index(fields=['finished_at', 'id'], name='profile_ser_finishe_9b4b9c_idx'),
+        ),
+    ]
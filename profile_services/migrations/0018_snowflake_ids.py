@@ -0,0 +1,41 @@
+# Generated by Django 4.0.4 on 2026-10-19 12:40
+
+from django.db import migrations, models
+import social_media_platform_api.snowflake
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profile_services', '0017_soft_delete'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='post',
+            name='profile_ser_created_eb2aea_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='post',
+            name='profile_ser_profile_1865e9_idx',
+        ),
+        migrations.AlterField(
+            model_name='comment',
+            name='id',
+            field=models.BigIntegerField(default=social_media_platform_api.snowflake.next_id, editable=False, primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name='like',
+            name='id',
+            field=models.BigIntegerField(default=social_media_platform_api.snowflake.next_id, editable=False, primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='id',
+            field=models.BigIntegerField(default=social_media_platform_api.snowflake.next_id, editable=False, primary_key=True, serialize=False),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['profile', '-id'], name='profile_ser_profile_6f7160_idx'),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 4.0.4 on 2026-10-19 12:54
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+BATCH_SIZE = 1000
+PATH_STEP = 16
+
+
+def set_root_paths(apps, schema_editor):
+    """
+    Every existing comment starts a thread of its own.
+    """
+    Comment = apps.get_model("profile_services", "Comment")
+
+    last_id = None
+    while True:
+        batch = Comment.objects.order_by("id")
+        if last_id is not None:
+            batch = batch.filter(id__gt=last_id)
+        batch = list(batch.only("id")[:BATCH_SIZE])
+        if not batch:
+            break
+        last_id = batch[-1].id
+
+        for comment in batch:
+            comment.path = f"{comment.id:0{PATH_STEP}x}"
+        Comment.objects.bulk_update(batch, ["path"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("profile_services", "0019_profilercapture"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="comment",
+            name="parent",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="replies",
+                to="profile_services.comment",
+            ),
+        ),
+        migrations.AddField(
+            model_name="comment",
+            name="path",
+            field=models.CharField(default="", editable=False, max_length=256),
+            preserve_default=False,
+        ),
+        migrations.RunPython(set_root_paths, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="comment",
+            index=models.Index(
+                fields=["post", "path"], name="profile_ser_post_id_361853_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.0.4 on 2026-10-19 12:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profile_services', '0020_comment_threads'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='last_seen_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.0.4 on 2026-10-19 13:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profile_services', '0021_profile_last_seen_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='deletionjob',
+            name='cursor',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.0.4 on 2026-10-19 13:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profile_services', '0022_deletionjob_cursor'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='deletionjob',
+            name='kind',
+            field=models.CharField(choices=[('user', 'User'), ('profile', 'Profile'), ('post', 'Post')], max_length=10),
+        ),
+    ]
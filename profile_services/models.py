@@ -1,12 +1,36 @@
+import json
 import os.path
 import uuid
+import zlib
 
 from django.contrib.auth import get_user_model
 from django.db import models
 
+from social_media_platform_api.snowflake import next_id
+
 User = get_user_model()
 
 
+class AliveManager(models.Manager):
+    """
+    Hides soft-deleted rows; ``all_objects`` still sees them until the
+    reaper removes them.
+    """
+
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+
+class ByLiveUserManager(models.Manager):
+    """
+    Hides the rows of soft-deleted users; ``all_objects`` still sees them
+    until the reaper removes them.
+    """
+
+    def get_queryset(self):
+        return super().get_queryset().filter(user__deleted_at__isnull=True)
+
+
 def profile_image_file_path(instance, filename):
     _, extension = os.path.splitext(
         filename,
@@ -21,9 +45,14 @@ class Profile(models.Model):
         upload_to=profile_image_file_path, null=True, blank=True
     )
     bio = models.TextField(blank=True)
-    posts = models.ManyToManyField("Post", related_name="profiles", blank=True)
     followers = models.ManyToManyField(User, related_name="followers", blank=True)
     following = models.ManyToManyField(User, related_name="following", blank=True)
+    deleted_at = models.DateTimeField(null=True, blank=True)
+    # When the user last loaded the home screen; its counters start here.
+    last_seen_at = models.DateTimeField(null=True, blank=True)
+
+    objects = AliveManager()
+    all_objects = models.Manager()
 
     def __str__(self):
         return self.user.username
@@ -38,41 +67,212 @@ def post_image_file_path(instance, filename):
 
 
 class Tag(models.Model):
-    name = models.CharField(max_length=255)
+    name = models.CharField(max_length=255, unique=True)
 
     def __str__(self):
         return self.name
 
 
 class Post(models.Model):
+    id = models.BigIntegerField(primary_key=True, default=next_id, editable=False)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
-    profile = models.ForeignKey(Profile, on_delete=models.CASCADE)
+    profile = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name="posts")
     post_image = models.ImageField(upload_to=post_image_file_path)
     post_description = models.TextField()
     tags = models.ManyToManyField(Tag)
     created_at = models.DateTimeField(auto_now_add=True)
+    deleted_at = models.DateTimeField(null=True, blank=True)
+
+    objects = AliveManager()
+    all_objects = models.Manager()
+
+    class Meta:
+        indexes = [
+            # Ids are time-ordered: newest first is ``-id``.
+            models.Index(fields=["profile", "-id"]),
+        ]
 
     def __str__(self):
         return f"Post by {self.user.username} was created at {self.created_at}"
 
 
 class Like(models.Model):
+    id = models.BigIntegerField(primary_key=True, default=next_id, editable=False)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="likes")
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = ByLiveUserManager()
+    all_objects = models.Manager()
+
     class Meta:
         unique_together = ["user", "post"]
+        indexes = [models.Index(fields=["post", "user"])]
 
     def __str__(self):
         return f"Like by {self.user.username}"
 
 
 class Comment(models.Model):
+    """
+    A comment on a post, or a reply to another comment of the same post.
+
+    ``path`` is the ids of the comment's ancestors and its own, each as
+    ``PATH_STEP`` hex digits, so ordering by ``path`` lists a thread
+    depth-first with siblings oldest first, and a comment's subtree is the
+    ``path`` range that starts with its own. See ``threads.py``.
+    """
+
+    PATH_STEP = 16
+    MAX_DEPTH = 16
+
+    id = models.BigIntegerField(primary_key=True, default=next_id, editable=False)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="comments")
+    parent = models.ForeignKey(
+        "self",
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="replies",
+    )
+    path = models.CharField(max_length=PATH_STEP * MAX_DEPTH, editable=False)
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = ByLiveUserManager()
+    all_objects = models.Manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["post", "created_at"]),
+            models.Index(fields=["post", "path"]),
+        ]
+
     def __str__(self):
-        return f"Comment by {self.user.username} on {self.post.id}"
+        return f"Comment by {self.user.username} on {self.post_id}"
+
+    @classmethod
+    def path_step(cls, comment_id):
+        return f"{comment_id:0{cls.PATH_STEP}x}"
+
+    @property
+    def depth(self):
+        return len(self.path) // self.PATH_STEP
+
+    def save(self, *args, **kwargs):
+        if not self.path:
+            parent_path = self.parent.path if self.parent_id else ""
+            self.path = parent_path + self.path_step(self.pk)
+        super().save(*args, **kwargs)
+
+
+class EngagementSegment(models.Model):
+    """
+    Likes or comments of one post created in one month, moved out of the
+    live tables by ``archive_engagement`` and stored as a compressed JSON
+    array of rows.
+    """
+
+    LIKES = "like"
+    COMMENTS = "comment"
+    KIND_CHOICES = ((LIKES, "Likes"), (COMMENTS, "Comments"))
+
+    post = models.ForeignKey(
+        Post, on_delete=models.CASCADE, related_name="engagement_segments"
+    )
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    month = models.DateField()
+    row_count = models.PositiveIntegerField()
+    data = models.BinaryField()
+
+    class Meta:
+        indexes = [models.Index(fields=["post", "kind", "month"])]
+
+    def __str__(self):
+        return f"{self.row_count} archived {self.kind}s of post {self.post_id}"
+
+    @staticmethod
+    def pack(rows):
+        return zlib.compress(json.dumps(rows, separators=(",", ":")).encode())
+
+    def rows(self):
+        return json.loads(zlib.decompress(self.data))
+
+
+class OutboxEvent(models.Model):
+    """
+    A side effect of a write, stored in the write's transaction and
+    delivered later by ``relay_outbox``.
+    """
+
+    topic = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+    available_at = models.DateTimeField(auto_now_add=True)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["available_at", "id"])]
+
+    def __str__(self):
+        return f"{self.topic} #{self.id}"
+
+
+class DeletionJob(models.Model):
+    """
+    A soft-deleted user, profile or post whose rows ``reap_deletions`` is
+    removing, step by step, in batches.
+    """
+
+    USER = "user"
+    PROFILE = "profile"
+    POST = "post"
+    KIND_CHOICES = ((USER, "User"), (PROFILE, "Profile"), (POST, "Post"))
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    object_id = models.PositiveBigIntegerField()
+    step = models.PositiveSmallIntegerField(default=0)
+    rows_total = models.PositiveBigIntegerField(null=True, blank=True)
+    rows_deleted = models.PositiveBigIntegerField(default=0)
+    # The last primary key handled by a step that scans rows instead of
+    # deleting them.
+    cursor = models.PositiveBigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["finished_at", "id"])]
+
+    def __str__(self):
+        return f"Deletion of {self.kind} {self.object_id}"
+
+
+class ProfilerCapture(models.Model):
+    """
+    Stacks sampled from one staff request by the sampling profiler, as
+    compressed collapsed-stack text (``frame;frame;frame count`` lines).
+    """
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    user = models.ForeignKey(
+        User, null=True, blank=True, on_delete=models.SET_NULL, related_name="+"
+    )
+    method = models.CharField(max_length=10)
+    path = models.TextField()
+    status_code = models.PositiveSmallIntegerField()
+    duration_ms = models.FloatField()
+    interval_ms = models.FloatField()
+    sample_count = models.PositiveIntegerField()
+    data = models.BinaryField()
+
+    def __str__(self):
+        return f"{self.method} {self.path} at {self.created_at}"
+
+    @staticmethod
+    def pack(collapsed):
+        return zlib.compress(collapsed.encode())
+
+    def collapsed(self):
+        return zlib.decompress(self.data).decode()
@@ -0,0 +1,266 @@
+"""
+NDJSON export and bulk import of users, profiles, posts and engagement.
+
+Every line is one row: ``{"type": "post", "id": 1, ...}``. Exports are
+written in dependency order (users before profiles before posts, ...) and
+read with ``QuerySet.iterator()``, so memory stays flat however big the
+dataset is. The importer buffers lines, writes them with ``bulk_create`` in
+the same order and records a byte-offset checkpoint after every committed
+batch. Primary keys are preserved and conflicts ignored, so rerunning or
+resuming an import is safe.
+
+Archived engagement segments are not part of the format.
+"""
+import contextlib
+import datetime
+import json
+import os
+from operator import itemgetter
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.color import no_style
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+
+from profile_services.models import Profile, Post, Tag, Like, Comment
+
+EXPORT_CHUNK_SIZE = 2000
+# Record types older exports may contain. "profile_post" rows duplicated
+# Post.profile_id and are skipped.
+RETIRED_TYPES = {"profile_post"}
+
+
+def _specs():
+    """
+    ``(type, model, columns, filter for one user's export)``, in dependency
+    order.
+    """
+    User = get_user_model()
+    return (
+        (
+            "user",
+            User,
+            ("id", "username", "email", "first_name", "last_name", "date_joined"),
+            "id",
+        ),
+        ("profile", Profile, ("id", "user_id", "profile_picture", "bio"), "user"),
+        ("tag", Tag, ("id", "name"), "post__user"),
+        (
+            "post",
+            Post,
+            (
+                "id",
+                "user_id",
+                "profile_id",
+                "post_image",
+                "post_description",
+                "created_at",
+            ),
+            "user",
+        ),
+        ("post_tag", Post.tags.through, ("post_id", "tag_id"), "post__user"),
+        ("like", Like, ("id", "user_id", "post_id", "created_at"), "user"),
+        (
+            "comment",
+            Comment,
+            ("id", "user_id", "post_id", "parent_id", "content", "created_at"),
+            "user",
+        ),
+        (
+            "follower",
+            Profile.followers.through,
+            ("profile_id", "user_id"),
+            "profile__user",
+        ),
+        (
+            "following",
+            Profile.following.through,
+            ("profile_id", "user_id"),
+            "profile__user",
+        ),
+    )
+
+
+class _Encoder(DjangoJSONEncoder):
+    # DjangoJSONEncoder truncates datetimes to milliseconds; keep them exact
+    # so an import reproduces the original rows.
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def _references():
+    User = get_user_model()
+    return {
+        "user_id": User,
+        "profile_id": Profile,
+        "post_id": Post,
+        "tag_id": Tag,
+        "parent_id": Comment,
+    }
+
+
+def export_lines(user=None):
+    """
+    Yield NDJSON lines for ``user``'s data, or for the whole site.
+    """
+    encoder = _Encoder(separators=(",", ":"))
+    for record_type, model, columns, user_filter in _specs():
+        queryset = model.objects.order_by("pk")
+        if user is not None:
+            # A subquery rather than distinct(): tags reach the user through
+            # posts, and DISTINCT would need a temporary sort.
+            owned = model.objects.filter(**{user_filter: user.pk}).values("pk")
+            queryset = queryset.filter(pk__in=owned)
+        for row in queryset.values(*columns).iterator(chunk_size=EXPORT_CHUNK_SIZE):
+            yield encoder.encode({"type": record_type, **row}) + "\n"
+
+
+@contextlib.contextmanager
+def _keep_timestamps():
+    # bulk_create runs pre_save(), which would stamp auto_now_add fields
+    # with the import time instead of the exported value.
+    fields = [
+        field
+        for model in (Post, Like, Comment)
+        for field in model._meta.concrete_fields
+        if getattr(field, "auto_now_add", False)
+    ]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def _existing(model, ids):
+    return set(model.objects.filter(pk__in=ids).values_list("pk", flat=True))
+
+
+def _set_paths(rows):
+    # bulk_create() skips Comment.save(), which sets the path. Rows come in
+    # id order, so a reply's parent is in the database or before it.
+    paths = dict(
+        Comment.objects.filter(
+            pk__in={row["parent_id"] for row in rows} - {row["id"] for row in rows}
+        ).values_list("pk", "path")
+    )
+    for row in rows:
+        parent_path = paths[row["parent_id"]] if row["parent_id"] else ""
+        row["path"] = paths[row["id"]] = parent_path + Comment.path_step(row["id"])
+
+
+def _write_batch(buffered, specs, references):
+    """
+    Insert buffered rows type by type, dropping rows whose foreign keys
+    point at rows that exist neither in the database nor in this batch.
+    """
+    written = 0
+    for record_type, model, columns, _ in specs:
+        rows = buffered.get(record_type)
+        if not rows:
+            continue
+
+        for column, referenced_model in references.items():
+            if column not in columns:
+                continue
+            known = _existing(referenced_model, {row[column] for row in rows})
+            if referenced_model is model:
+                # Rows may refer to earlier rows of the batch.
+                rows.sort(key=itemgetter("id"))
+                kept = []
+                for row in rows:
+                    if row[column] is None or row[column] in known:
+                        kept.append(row)
+                        known.add(row["id"])
+                rows = kept
+            else:
+                rows = [row for row in rows if row[column] in known]
+
+        if record_type == "user":
+            for row in rows:
+                row["password"] = make_password(None)
+        elif record_type == "comment":
+            _set_paths(rows)
+        model.objects.bulk_create((model(**row) for row in rows), ignore_conflicts=True)
+        written += len(rows)
+    return written
+
+
+def _save_checkpoint(path, offset, lines):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as checkpoint:
+        json.dump({"offset": offset, "lines": lines}, checkpoint)
+    os.replace(tmp_path, path)
+
+
+def _load_checkpoint(path):
+    if path and os.path.exists(path):
+        with open(path) as checkpoint:
+            return json.load(checkpoint)
+    return {"offset": 0, "lines": 0}
+
+
+def _reset_sequences(specs):
+    statements = connection.ops.sequence_reset_sql(
+        no_style(), [model for _, model, _, _ in specs]
+    )
+    if statements:
+        with connection.cursor() as cursor:
+            for statement in statements:
+                cursor.execute(statement)
+
+
+def import_ndjson(path, batch_size=1000, checkpoint_path=None):
+    """
+    Load an NDJSON export from ``path``. With ``checkpoint_path`` the import
+    resumes from the last committed batch. Returns ``(lines read, rows
+    written)`` for this run.
+    """
+    specs = _specs()
+    columns = {record_type: cols for record_type, _, cols, _ in specs}
+    references = _references()
+    state = _load_checkpoint(checkpoint_path)
+
+    lines_read = rows_written = 0
+    buffered = {}
+    buffered_count = 0
+
+    def flush(offset):
+        nonlocal rows_written, buffered, buffered_count
+        with transaction.atomic():
+            rows_written += _write_batch(buffered, specs, references)
+        buffered, buffered_count = {}, 0
+        if checkpoint_path:
+            _save_checkpoint(checkpoint_path, offset, state["lines"] + lines_read)
+
+    with open(path, "rb") as source, _keep_timestamps():
+        source.seek(state["offset"])
+        while True:
+            line = source.readline()
+            if not line:
+                break
+            lines_read += 1
+            if not line.strip():
+                continue
+
+            record = json.loads(line)
+            record_type = record.pop("type")
+            if record_type in RETIRED_TYPES:
+                continue
+            buffered.setdefault(record_type, []).append(
+                {key: record[key] for key in columns[record_type]}
+            )
+            buffered_count += 1
+            if buffered_count >= batch_size:
+                flush(source.tell())
+
+        if buffered_count:
+            flush(source.tell())
+
+    _reset_sequences(specs)
+    return lines_read, rows_written
@@ -0,0 +1,130 @@
+"""
+Transactional outbox.
+
+Writes call ``publish()`` inside the transaction that makes the change, so
+an event exists exactly when the change was committed, and the request
+does no side-effect work itself. ``relay()`` (``manage.py relay_outbox``)
+drains the table in batches and hands each event to the handlers
+registered for its topic, either in process (``OUTBOX_BACKEND = "local"``)
+or through a Celery task (``"celery"``).
+
+Delivery is at least once: an event is deleted only after delivery, so a
+relay that dies in between delivers it again. Handlers must be
+idempotent; ``event.id`` is stable across redeliveries. Events of a topic
+no handler is registered for are left queued, untouched, until one is.
+
+Handlers live in ``outbox_handlers`` modules of installed apps::
+
+    from profile_services.outbox import handler
+
+    @handler("post.created")
+    def fan_out(event):
+        ...
+"""
+import collections
+import datetime
+import functools
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.module_loading import autodiscover_modules
+
+from profile_services.models import OutboxEvent
+
+Event = collections.namedtuple("Event", ("id", "topic", "payload"))
+
+_handlers = collections.defaultdict(list)
+
+
+def handler(topic):
+    def register(func):
+        _handlers[topic].append(func)
+        return func
+
+    return register
+
+
+def publish(topic, **payload):
+    """
+    Record an event. Call it inside the ``transaction.atomic()`` block of
+    the write it belongs to.
+    """
+    return OutboxEvent.objects.create(topic=topic, payload=payload)
+
+
+@functools.lru_cache(maxsize=None)
+def _discover_handlers():
+    autodiscover_modules("outbox_handlers")
+
+
+def handled_topics():
+    _discover_handlers()
+    return sorted(topic for topic, funcs in _handlers.items() if funcs)
+
+
+def dispatch(event):
+    _discover_handlers()
+    for func in _handlers.get(event.topic, ()):
+        func(event)
+
+
+def _deliver_local(event):
+    # A savepoint per event, so a handler's failed writes don't break the
+    # relay's transaction.
+    with transaction.atomic():
+        dispatch(event)
+
+
+def _deliver_celery(event):
+    from profile_services.tasks import deliver_outbox_event
+
+    deliver_outbox_event.delay(event.id, event.topic, event.payload)
+
+
+BACKENDS = {"local": _deliver_local, "celery": _deliver_celery}
+
+
+def _retry_delay(attempts):
+    return datetime.timedelta(seconds=min(2**attempts, 3600))
+
+
+def relay(batch_size=None, backend=None):
+    """
+    Deliver one batch of due events. Returns ``(delivered, failed)``.
+    """
+    batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+    deliver = BACKENDS[backend or settings.OUTBOX_BACKEND]
+    topics = handled_topics()
+    if not topics:
+        return 0, 0
+    now = timezone.now()
+
+    with transaction.atomic():
+        queryset = OutboxEvent.objects.filter(
+            topic__in=topics,
+            available_at__lte=now,
+            attempts__lt=settings.OUTBOX_MAX_ATTEMPTS,
+        ).order_by("available_at", "id")
+        if connection.features.has_select_for_update_skip_locked:
+            # Lets several relays drain the table side by side.
+            queryset = queryset.select_for_update(skip_locked=True)
+        events = list(queryset[:batch_size])
+
+        delivered = []
+        for event in events:
+            try:
+                deliver(Event(event.id, event.topic, event.payload))
+            except Exception as error:
+                event.attempts += 1
+                OutboxEvent.objects.filter(id=event.id).update(
+                    attempts=event.attempts,
+                    available_at=now + _retry_delay(event.attempts),
+                    last_error=repr(error),
+                )
+            else:
+                delivered.append(event.id)
+
+        OutboxEvent.objects.filter(id__in=delivered).delete()
+
+    return len(delivered), len(events) - len(delivered)
@@ -11,6 +11,6 @@ class IsAdminOrIfAuthenticatedReadOnly(BasePermission):
             return True
         if view.action in ["update", "partial_update", "destroy"]:
             object = view.get_object()
-            if hasattr(object, "user") and object.user == request.user:
+            if hasattr(object, "user_id") and object.user_id == request.user.id:
                 return True
         return False
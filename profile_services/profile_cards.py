@@ -0,0 +1,183 @@
+"""
+Profile cards.
+
+A card is the small summary of a user that posts, comments, likes and
+profile lists render: ``{id, username, avatar, posts, followers,
+following}``, where ``avatar`` is the stored name of the profile picture.
+Cards live in the cache named by ``PROFILE_CARD_CACHE`` and are read with
+one multi-get per response; the misses are loaded with one query and
+written back with one multi-set.
+
+``prime_cards()`` stores a response's cards in the request's identity map,
+so ``UsernameField`` and the fast path look each user up in memory. A
+card is dropped from the cache when its user, profile, posts or follows
+change (after the transaction commits) and expires after
+``PROFILE_CARD_TIMEOUT`` seconds in any case. Only a shared cache (Redis)
+makes the drop reach every process (check ``profile_services.W001``).
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import F, Func, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from profile_services.identity_map import get_identity_map
+from profile_services.models import Profile, Post
+from social_media_platform_api.metrics import record_cache
+
+CARD_KEY = "profile-card:{}"
+
+
+def _cache():
+    return caches[settings.PROFILE_CARD_CACHE]
+
+
+def _count(queryset):
+    # COUNT(*) of a correlated subquery, without the GROUP BY Django adds
+    # for aggregates.
+    return Coalesce(
+        Subquery(
+            queryset.order_by()
+            .annotate(count=Func(F("pk"), function="COUNT"))
+            .values("count"),
+            output_field=IntegerField(),
+        ),
+        0,
+    )
+
+
+def _load_cards(user_ids):
+    rows = (
+        get_user_model()
+        .objects.filter(id__in=user_ids, deleted_at__isnull=True)
+        .annotate(
+            posts=_count(Post.objects.filter(user_id=OuterRef("pk"))),
+            followers_count=_count(
+                Profile.followers.through.objects.filter(
+                    profile__user_id=OuterRef("pk")
+                )
+            ),
+            following_count=_count(
+                Profile.following.through.objects.filter(
+                    profile__user_id=OuterRef("pk")
+                )
+            ),
+        )
+        .values(
+            "id",
+            "username",
+            "profile__profile_picture",
+            "posts",
+            "followers_count",
+            "following_count",
+        )
+    )
+    return {
+        row["id"]: {
+            "id": row["id"],
+            "username": row["username"],
+            "avatar": row["profile__profile_picture"] or None,
+            "posts": row["posts"],
+            "followers": row["followers_count"],
+            "following": row["following_count"],
+        }
+        for row in rows
+    }
+
+
+def get_cards(user_ids):
+    """
+    Return ``{user id: card}`` for the existing users among ``user_ids``,
+    not counting soft-deleted ones.
+    """
+    user_ids = set(user_ids)
+    if not user_ids:
+        return {}
+
+    cache = _cache()
+    cached = cache.get_many([CARD_KEY.format(user_id) for user_id in user_ids])
+    cards = {card["id"]: card for card in cached.values()}
+    missing = user_ids - cards.keys()
+    record_cache("profile_card", len(cards), len(missing))
+    if missing:
+        loaded = _load_cards(missing)
+        cache.set_many(
+            {CARD_KEY.format(user_id): card for user_id, card in loaded.items()},
+            settings.PROFILE_CARD_TIMEOUT,
+        )
+        cards.update(loaded)
+    return cards
+
+
+def prime_cards(request, user_ids):
+    """
+    Fetch the cards of ``user_ids`` that the request hasn't seen yet and
+    remember them for the rest of the request. Returns ``{user id: card}``
+    for all of ``user_ids``.
+    """
+    if request is None:
+        return get_cards(user_ids)
+
+    identity_map = get_identity_map(request)
+    cards = {}
+    for user_id in set(user_ids):
+        card = identity_map.find(("profile_card", user_id))
+        if card is not None:
+            cards[user_id] = card
+    missing = [user_id for user_id in user_ids if user_id not in cards]
+    for user_id, card in get_cards(missing).items():
+        identity_map.add(("profile_card", user_id), card)
+        cards[user_id] = card
+    return cards
+
+
+def get_card(user_id, request=None):
+    return prime_cards(request, [user_id]).get(user_id)
+
+
+def card_username(user_id, request=None):
+    card = get_card(user_id, request)
+    return card["username"] if card else None
+
+
+def invalidate_cards(user_ids):
+    keys = [CARD_KEY.format(user_id) for user_id in user_ids]
+    if keys:
+        transaction.on_commit(lambda: _cache().delete_many(keys))
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def _user_changed(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and set(update_fields) == {"last_login"}:
+        return
+    invalidate_cards([instance.pk])
+
+
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+@receiver(post_delete, sender=Post)
+def _profile_or_post_changed(sender, instance, **kwargs):
+    invalidate_cards([instance.user_id])
+
+
+@receiver(post_save, sender=Post)
+def _post_saved(sender, instance, created, **kwargs):
+    if created:
+        invalidate_cards([instance.user_id])
+
+
+@receiver(m2m_changed, sender=Profile.followers.through)
+@receiver(m2m_changed, sender=Profile.following.through)
+def _follows_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith("post_"):
+        return
+    if not reverse:
+        invalidate_cards([instance.user_id])
+    elif pk_set:
+        invalidate_cards(
+            Profile.objects.filter(pk__in=pk_set).values_list("user_id", flat=True)
+        )
@@ -0,0 +1,166 @@
+"""
+Ranking stage for the feed and ``?ranked=1`` post lists.
+
+The newest ``FEED_CANDIDATES`` posts of a queryset are scored together.
+Features are gathered with one grouped query each into a column-oriented
+``FeatureBatch``, one numpy array per feature. Each column is computed for
+the whole batch at once, with the per-post counts looked up by sorted
+search, and the score is the weighted sum of the columns.
+
+Features, all per candidate post:
+
+- ``recency``: halves every ``FEED_RECENCY_HALF_LIFE_HOURS``.
+- ``like_velocity`` / ``comment_velocity``: ``log1p(count / (age_hours + 2))``.
+- ``affinity``: the viewer's recent likes and comments (comments count
+  double) on the author's posts, scaled to 0..1.
+- ``tag_overlap``: share of the viewer's recent tag interests that the
+  post's tags cover.
+"""
+from datetime import timedelta
+
+import numpy
+from django.conf import settings
+from django.db.models import Count
+from django.utils import timezone
+
+from profile_services.models import Post, Like, Comment
+
+FEATURES = (
+    "recency",
+    "like_velocity",
+    "comment_velocity",
+    "affinity",
+    "tag_overlap",
+)
+
+
+class FeatureBatch:
+    def __init__(self, post_ids):
+        self.post_ids = numpy.array(post_ids, dtype=numpy.int64)
+        self.columns = {name: numpy.zeros(len(post_ids)) for name in FEATURES}
+
+    def __len__(self):
+        return len(self.post_ids)
+
+    def scores(self, weights):
+        matrix = numpy.vstack([self.columns[name] for name in FEATURES])
+        return numpy.array([weights[name] for name in FEATURES]) @ matrix
+
+
+def _lookup(values, keys):
+    """
+    ``values[key]`` for every key in the array ``keys``, 0 where missing.
+    """
+    if not values:
+        return numpy.zeros(len(keys))
+    known = numpy.fromiter(values.keys(), numpy.int64, len(values))
+    found = numpy.fromiter(values.values(), numpy.float64, len(values))
+    order = numpy.argsort(known)
+    known, found = known[order], found[order]
+    positions = numpy.searchsorted(known, keys).clip(max=len(known) - 1)
+    return numpy.where(known[positions] == keys, found[positions], 0.0)
+
+
+def _counts(model, post_ids):
+    return dict(
+        model.objects.filter(post_id__in=post_ids)
+        .values("post_id")
+        .annotate(count=Count("id"))
+        .order_by()
+        .values_list("post_id", "count")
+    )
+
+
+def _author_affinity(user, since):
+    affinity = {}
+    for model, weight in ((Like, 1), (Comment, 2)):
+        for author_id, count in (
+            model.objects.filter(user_id=user.id, created_at__gte=since)
+            .values("post__user_id")
+            .annotate(count=Count("id"))
+            .order_by()
+            .values_list("post__user_id", "count")
+        ):
+            affinity[author_id] = affinity.get(author_id, 0) + weight * count
+    return affinity
+
+
+def _tag_interests(user, since):
+    return dict(
+        Post.tags.through.objects.filter(
+            post__likes__user_id=user.id, post__likes__created_at__gte=since
+        )
+        .values("tag_id")
+        .annotate(count=Count("id"))
+        .order_by()
+        .values_list("tag_id", "count")
+    )
+
+
+def build_features(candidates, user=None, now=None):
+    """
+    ``candidates`` are ``(post id, author id, created_at)`` rows.
+    """
+    now = now or timezone.now()
+    post_ids, author_ids, created_ats = zip(*candidates)
+    batch = FeatureBatch(post_ids)
+    likes = _counts(Like, post_ids)
+    comments = _counts(Comment, post_ids)
+
+    affinity = interests = {}
+    if user is not None and user.is_authenticated:
+        since = now - timedelta(days=settings.FEED_INTEREST_DAYS)
+        affinity = _author_affinity(user, since)
+        interests = _tag_interests(user, since)
+
+    created = numpy.fromiter(
+        (created_at.timestamp() for created_at in created_ats),
+        numpy.float64,
+        len(batch),
+    )
+    age_hours = numpy.maximum((now.timestamp() - created) / 3600, 0)
+    columns = batch.columns
+    columns["recency"] = 0.5 ** (age_hours / settings.FEED_RECENCY_HALF_LIFE_HOURS)
+    columns["like_velocity"] = numpy.log1p(
+        _lookup(likes, batch.post_ids) / (age_hours + 2)
+    )
+    columns["comment_velocity"] = numpy.log1p(
+        _lookup(comments, batch.post_ids) / (age_hours + 2)
+    )
+    columns["affinity"] = _lookup(
+        affinity, numpy.array(author_ids, dtype=numpy.int64)
+    ) / (max(affinity.values(), default=0) or 1)
+
+    if interests:
+        tagged = numpy.array(
+            Post.tags.through.objects.filter(post_id__in=post_ids).values_list(
+                "post_id", "tag_id"
+            ),
+            dtype=numpy.int64,
+        ).reshape(-1, 2)
+        # Sum each post's tag interests by the post's position in the batch.
+        order = numpy.argsort(batch.post_ids)
+        positions = order[numpy.searchsorted(batch.post_ids[order], tagged[:, 0])]
+        columns["tag_overlap"] = numpy.bincount(
+            positions, weights=_lookup(interests, tagged[:, 1]), minlength=len(batch)
+        ) / sum(interests.values())
+    return batch
+
+
+def rank_posts(queryset, user=None, limit=None):
+    """
+    Return the ids of the newest ``limit`` posts in ``queryset``, best
+    first.
+    """
+    limit = limit or settings.FEED_CANDIDATES
+    candidates = list(
+        queryset.prefetch_related(None)
+        .order_by("-id")
+        .values_list("id", "user_id", "created_at")[:limit]
+    )
+    if not candidates:
+        return []
+
+    batch = build_features(candidates, user)
+    scores = batch.scores(settings.FEED_RANKING_WEIGHTS)
+    return batch.post_ids[numpy.argsort(-scores, kind="stable")].tolist()
@@ -1,12 +1,104 @@
-from rest_framework import serializers
+from operator import attrgetter
 
+from django.db import IntegrityError, models
+from django.db.models import Prefetch, Subquery, prefetch_related_objects
+from rest_framework import serializers
+from rest_framework.validators import UniqueValidator
+
+from profile_services.archive import (
+    archived_comments,
+    archived_like_count,
+    archived_likes,
+    first_archived_likers,
+    like_segments,
+)
 from profile_services.models import Profile, Post, Like, Comment, Tag
+from profile_services.profile_cards import card_username, get_card, prime_cards
+from profile_services.tagging import (
+    MAX_NAME_LENGTH,
+    extract_hashtags,
+    normalize_tag,
+    tag_post,
+    untag_post,
+)
+from profile_services.viewer_flags import prime_followed, prime_liked, set_liked
 from user.serializers import UserSerializer
 
 
 class UsernameField(serializers.RelatedField):
+    """
+    The related user's username, read from its profile card by
+    ``<source>_id`` without loading the user.
+    """
+
+    def get_attribute(self, instance):
+        return getattr(instance, f"{self.source_attrs[-1]}_id")
+
+    def prime(self, items):
+        prime_cards(
+            self.context.get("request"), {self.get_attribute(item) for item in items}
+        )
+
     def to_representation(self, value):
-        return value.username
+        return card_username(value, self.context.get("request"))
+
+
+class SnowflakeIdField(serializers.IntegerField):
+    """
+    A snowflake id, rendered as a string: the ids are above 2**53, which
+    JavaScript numbers can't hold exactly.
+    """
+
+    def to_representation(self, value):
+        return str(value)
+
+
+class ViewerFlagField(serializers.Field):
+    """
+    A read-only flag relating the whole instance to the requesting user.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs["source"] = "*"
+        kwargs["read_only"] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, instance):
+        return instance.pk in self.prime([instance])
+
+
+class LikedByMeField(ViewerFlagField):
+    def prime(self, posts):
+        return prime_liked(
+            self.context.get("request"),
+            [post.pk for post in posts],
+            [post.pk for post in posts if archived_like_count(post)],
+        )
+
+
+class FollowedByMeField(ViewerFlagField):
+    def prime(self, profiles):
+        return prime_followed(
+            self.context.get("request"), [profile.pk for profile in profiles]
+        )
+
+
+class PrimingListSerializer(serializers.ListSerializer):
+    """
+    Lets the child serializer and every field with a ``prime(items)``
+    method (profile cards, viewer flags) look up what they need for all the
+    items at once before the items are rendered.
+    """
+
+    def to_representation(self, data):
+        items = list(data.all() if isinstance(data, models.Manager) else data)
+        if items:
+            for field in self.child.fields.values():
+                if hasattr(field, "prime"):
+                    field.prime(items)
+            if hasattr(self.child, "prime"):
+                self.child.prime(items)
+        return super().to_representation(items)
 
 
 class ProfileSerializer(serializers.ModelSerializer):
@@ -22,7 +114,12 @@ class ProfileSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         user = self.context["request"].user
-        if Profile.objects.filter(user=user).exists():
+        existing = Profile.all_objects.filter(user=user).values("deleted_at").first()
+        if existing is not None:
+            if existing["deleted_at"] is not None:
+                raise serializers.ValidationError(
+                    "The previous profile of this user is still being deleted."
+                )
             raise serializers.ValidationError("A profile already exists for this user.")
         validated_data["user"] = user
         return super().create(validated_data)
@@ -43,44 +140,156 @@ class ProfileSerializer(serializers.ModelSerializer):
 
 
 class ProfileListSerializer(serializers.ModelSerializer):
+    user = UsernameField(read_only=True)
+    followed_by_me = FollowedByMeField()
+
+    class Meta:
+        model = Profile
+        list_serializer_class = PrimingListSerializer
+        fields = ("id", "user", "profile_picture", "bio", "followed_by_me")
+
+
+class ProfileSummarySerializer(serializers.ModelSerializer):
+    """
+    A profile with the post, follower and following counts of its card.
+    """
+
     user = UsernameField(read_only=True)
 
     class Meta:
         model = Profile
         fields = ("id", "user", "profile_picture", "bio")
 
+    def to_representation(self, instance):
+        representation = super().to_representation(instance)
+        card = get_card(instance.user_id, self.context.get("request")) or {}
+        for count in ("posts", "followers", "following"):
+            representation[count] = card.get(count, 0)
+        return representation
+
 
 class CommentSerializer(serializers.ModelSerializer):
     user = UsernameField(read_only=True)
 
     class Meta:
         model = Comment
+        list_serializer_class = PrimingListSerializer
         fields = ["user", "content"]
         read_only_fields = ["id"]
 
 
+class CommentThreadSerializer(serializers.ModelSerializer):
+    id = SnowflakeIdField(read_only=True)
+    user = UsernameField(read_only=True)
+    parent = serializers.PrimaryKeyRelatedField(
+        read_only=True, pk_field=SnowflakeIdField()
+    )
+
+    class Meta:
+        model = Comment
+        list_serializer_class = PrimingListSerializer
+        fields = ("id", "user", "parent", "content", "created_at")
+        read_only_fields = fields
+
+
 class LikeSerializer(serializers.ModelSerializer):
     user = UsernameField(read_only=True)
 
     class Meta:
         model = Like
+        list_serializer_class = PrimingListSerializer
         fields = ("user",)
 
 
+def set_prefetched(instance, **related):
+    """
+    Fill the prefetch cache of ``instance`` with known related objects, as
+    ``prefetch_related()`` would, without a query.
+    """
+    prefetch_related_objects(
+        [instance],
+        *(
+            Prefetch(name, queryset=getattr(instance, name).model.objects.none())
+            for name in related
+        ),
+    )
+    for name, objects in related.items():
+        getattr(instance, name).all()._result_cache = list(objects)
+
+
+def first_like(likes):
+    # The oldest like, as on the fast path, whatever order the rows came in.
+    return min(likes, key=attrgetter("id"))
+
+
 class LikeRepresentationMixin:
+    def prime(self, posts):
+        # The first like is the one named, or the only one listed.
+        request = self.context.get("request")
+        archived = first_archived_likers(
+            {post.pk: like_segments(post) for post in posts}, request
+        )
+        prime_cards(
+            request,
+            {
+                first_like(likes).user_id
+                for likes in (
+                    post.likes.all() for post in posts if post.pk not in archived
+                )
+                if likes
+            },
+        )
+
     def to_representation(self, instance):
         representation = super().to_representation(instance)
-        likes = instance.likes.all()
-
-        if likes.count() >= 2:
-            representation["likes"] = f"{likes[0]} and {likes.count() - 1} other users"
+        request = self.context.get("request")
+        likes = list(instance.likes.all())
+        count = archived_like_count(instance) + len(likes)
+
+        if count >= 2:
+            # Archived likes predate the live ones; skip those of deleted users.
+            user_id = first_archived_likers(
+                {instance.pk: like_segments(instance)}, request
+            ).get(instance.pk)
+            if user_id is None and likes:
+                user_id = first_like(likes).user_id
+            username = None if user_id is None else card_username(user_id, request)
+            representation["likes"] = f"Like by {username} and {count - 1} other users"
         else:
-            representation["likes"] = LikeSerializer(likes, many=True).data
+            representation["likes"] = LikeSerializer(
+                archived_likes(instance) + likes, many=True, context=self.context
+            ).data
+
+        if "comments" in representation:
+            archived = archived_comments(instance)
+            if archived:
+                representation["comments"] = (
+                    CommentSerializer(archived, many=True, context=self.context).data
+                    + representation["comments"]
+                )
 
         return representation
 
 
+class TagNameField(serializers.CharField):
+    """
+    A tag name, normalized before the validators see it, so names that
+    differ only in case or a leading "#" are the same tag.
+    """
+
+    def to_internal_value(self, data):
+        name = normalize_tag(super().to_internal_value(data))
+        if not name:
+            self.fail("blank")
+        return name
+
+
 class TagSerializer(serializers.ModelSerializer):
+    name = TagNameField(
+        max_length=MAX_NAME_LENGTH,
+        validators=[UniqueValidator(queryset=Tag.objects.all())],
+    )
+
     class Meta:
         model = Tag
         fields = ("name",)
@@ -88,14 +297,24 @@ class TagSerializer(serializers.ModelSerializer):
     def to_representation(self, instance):
         return instance.name
 
+    @property
+    def data(self):
+        # A bare name can't be wrapped in the ReturnDict ``data`` builds.
+        if self.instance is None or self._errors:
+            return super().data
+        return self.to_representation(self.instance)
+
 
 class PostSerializer(LikeRepresentationMixin, serializers.ModelSerializer):
+    id = SnowflakeIdField(read_only=True)
     user = UsernameField(read_only=True)
     comments = CommentSerializer(many=True, read_only=True)
     tags = TagSerializer(many=True, read_only=True)
+    liked_by_me = LikedByMeField()
 
     class Meta:
         model = Post
+        list_serializer_class = PrimingListSerializer
         fields = (
             "id",
             "user",
@@ -105,6 +324,7 @@ class PostSerializer(LikeRepresentationMixin, serializers.ModelSerializer):
             "comments",
             "tags",
             "likes",
+            "liked_by_me",
         )
         read_only_fields = (
             "created_at",
@@ -113,33 +333,38 @@ class PostSerializer(LikeRepresentationMixin, serializers.ModelSerializer):
 
     def create(self, validated_data):
         user = self.context["request"].user
-        profile = user.profile
         validated_data["user"] = user
-        validated_data["profile_id"] = profile.id
-        post = Post.objects.create(**validated_data)
+        # Resolved inside the INSERT instead of fetching the profile first.
+        validated_data["profile_id"] = Subquery(
+            Profile.objects.filter(user_id=user.id).values("id")
+        )
+        try:
+            post = Post.objects.create(**validated_data)
+        except IntegrityError:
+            raise serializers.ValidationError("Create a profile before posting.")
+        tags = tag_post(post, extract_hashtags(post.post_description))
+        set_liked(self.context.get("request"), post.pk, False)
+        # Only the database knows the profile id; deferred, it is loaded if
+        # anything reads it.
+        del post.__dict__["profile_id"]
+        # A new post has nothing but its tags to render.
+        set_prefetched(post, tags=tags, likes=[], comments=[], engagement_segments=[])
         return post
 
     def update(self, instance, validated_data):
-        user_data = validated_data.pop("user", None)
-        user_serializer = self.fields["user"]
-        user_instance = instance.user
-
-        user_serializer.update(user_instance, user_data)
-
+        old_hashtags = extract_hashtags(instance.post_description)
         instance.post_image = validated_data.get("post_image", instance.post_image)
         instance.post_description = validated_data.get(
             "post_description", instance.post_description
         )
-        instance.created_at = validated_data.get("created_at", instance.created_at)
-
-        tags_data = validated_data.pop("tags", None)
-        if tags_data is not None:
-            instance.tags.clear()
-            for tag_data in tags_data:
-                tag, _ = Tag.objects.get_or_create(name=tag_data["name"])
-                instance.tags.add(tag)
-
         instance.save()
+
+        if "post_description" in validated_data:
+            hashtags = extract_hashtags(instance.post_description)
+            tag_post(instance, hashtags)
+            # Only hashtags that were edited out; tags added through add_tag
+            # stay.
+            untag_post(instance, set(old_hashtags) - set(hashtags))
         return instance
 
     def delete(self, instance):
@@ -147,12 +372,15 @@ class PostSerializer(LikeRepresentationMixin, serializers.ModelSerializer):
 
 
 class PostDetailSerializer(LikeRepresentationMixin, serializers.ModelSerializer):
+    id = SnowflakeIdField(read_only=True)
     user = UsernameField(read_only=True)
     comments = CommentSerializer(many=True, read_only=True)
     tags = TagSerializer(many=True, read_only=True)
+    liked_by_me = LikedByMeField()
 
     class Meta:
         model = Post
+        list_serializer_class = PrimingListSerializer
         fields = (
             "id",
             "user",
@@ -160,6 +388,7 @@ class PostDetailSerializer(LikeRepresentationMixin, serializers.ModelSerializer)
             "post_description",
             "tags",
             "likes",
+            "liked_by_me",
             "comments",
         )
         read_only_fields = (
@@ -169,11 +398,14 @@ class PostDetailSerializer(LikeRepresentationMixin, serializers.ModelSerializer)
 
 
 class PostListSerializer(LikeRepresentationMixin, serializers.ModelSerializer):
+    id = SnowflakeIdField(read_only=True)
     user = UsernameField(read_only=True)
     tags = TagSerializer(many=True)
+    liked_by_me = LikedByMeField()
 
     class Meta:
         model = Post
+        list_serializer_class = PrimingListSerializer
         fields = (
             "id",
             "user",
@@ -181,6 +413,7 @@ class PostListSerializer(LikeRepresentationMixin, serializers.ModelSerializer):
             "post_description",
             "tags",
             "likes",
+            "liked_by_me",
             "created_at",
         )
         read_only_fields = ("created_at",)
@@ -191,6 +424,7 @@ class ProfileDetailSerializer(serializers.ModelSerializer):
     posts = PostSerializer(many=True, read_only=True)
     followers = UserSerializer(many=True, read_only=True)
     following = UserSerializer(many=True, read_only=True)
+    followed_by_me = FollowedByMeField()
 
     class Meta:
         model = Profile
@@ -199,6 +433,7 @@ class ProfileDetailSerializer(serializers.ModelSerializer):
             "user",
             "profile_picture",
             "bio",
+            "followed_by_me",
             "posts",
             "followers",
             "following",
@@ -210,6 +445,7 @@ class ProfileDetailUpdateSerializer(serializers.ModelSerializer):
     posts = PostSerializer(many=True, read_only=True)
     followers = UserSerializer(many=True, read_only=True)
     following = UserSerializer(many=True, read_only=True)
+    followed_by_me = FollowedByMeField()
 
     class Meta:
         model = Profile
@@ -218,6 +454,7 @@ class ProfileDetailUpdateSerializer(serializers.ModelSerializer):
             "user",
             "profile_picture",
             "bio",
+            "followed_by_me",
             "posts",
             "followers",
             "following",
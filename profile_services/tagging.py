@@ -0,0 +1,57 @@
+"""
+Tagging posts in a constant number of queries.
+
+``tag_post()`` inserts any missing tags with one ``INSERT ... ON CONFLICT
+DO NOTHING`` (``Tag.name`` is unique), reads them back with one query and
+links them to the post with one bulk insert into the through table,
+whatever the number of tags. ``untag_post()`` unlinks tags with one delete.
+"""
+import re
+
+from profile_services.models import Post, Tag
+
+HASHTAG = re.compile(r"(?<![\w#])#(\w+)")
+MAX_NAME_LENGTH = Tag._meta.get_field("name").max_length
+
+
+def normalize_tag(name):
+    return name.strip().lstrip("#").strip().lower()[:MAX_NAME_LENGTH]
+
+
+def extract_hashtags(text):
+    """
+    ``#hashtag`` names in ``text``, normalized, in order of appearance and
+    without duplicates.
+    """
+    return list(dict.fromkeys(normalize_tag(name) for name in HASHTAG.findall(text)))
+
+
+def resolve_tags(names):
+    names = list(dict.fromkeys(names))
+    if not names:
+        return []
+    Tag.objects.bulk_create((Tag(name=name) for name in names), ignore_conflicts=True)
+    tags = {tag.name: tag for tag in Tag.objects.filter(name__in=names)}
+    return [tags[name] for name in names]
+
+
+def tag_post(post, names):
+    """
+    Attach the tags named ``names`` to ``post``, creating missing ones.
+    Returns the tags.
+    """
+    tags = resolve_tags(names)
+    if tags:
+        Post.tags.through.objects.bulk_create(
+            (Post.tags.through(post_id=post.pk, tag_id=tag.pk) for tag in tags),
+            ignore_conflicts=True,
+        )
+    return tags
+
+
+def untag_post(post, names):
+    """
+    Detach the tags named ``names`` from ``post``. The tags themselves stay.
+    """
+    if names:
+        Post.tags.through.objects.filter(post_id=post.pk, tag__name__in=names).delete()
@@ -0,0 +1,8 @@
+from celery import shared_task
+
+from profile_services.outbox import Event, dispatch
+
+
+@shared_task(acks_late=True, autoretry_for=(Exception,), retry_backoff=True)
+def deliver_outbox_event(event_id, topic, payload):
+    dispatch(Event(event_id, topic, payload))
@@ -0,0 +1,117 @@
+"""
+Comment threads.
+
+A comment's ``path`` starts with its parent's, so a subtree is the range
+``[path, path + "~")`` of the ``(post, path)`` index and comes back in
+thread order without a recursive query. ``top_threads()`` reads the first
+threads of a post with their first replies in one query, numbering the
+rows of each thread with window functions.
+
+Posts whose comments were archived keep part of their threads in
+``EngagementSegment`` rows. ``select_threads()`` and ``select_subtree()``
+do the same over comments in memory, the archived ones and the post's
+live comments together.
+"""
+from operator import attrgetter
+
+from django.db.models import Count, F, Window
+from django.db.models.functions import DenseRank, RowNumber, Substr
+
+from profile_services.models import Comment
+
+# Sorts after every hex digit.
+PATH_END = "~"
+
+MAX_THREADS = 100
+MAX_THREAD_REPLIES = 50
+
+
+def subtree(comment):
+    """
+    The replies to ``comment`` at every depth, in thread order.
+    """
+    return Comment.objects.filter(
+        post_id=comment.post_id,
+        path__gt=comment.path,
+        path__lt=comment.path + PATH_END,
+    ).order_by("path")
+
+
+def top_threads(post_id, threads, replies, after=None):
+    """
+    The oldest ``threads`` top-level comments of the post after the one
+    with id ``after``, each followed by its first ``replies`` replies in
+    thread order. Every comment carries ``thread_size``, the number of
+    comments in its thread.
+    """
+    thread = Substr("path", 1, Comment.PATH_STEP)
+    comments = Comment.objects.filter(post_id=post_id)
+    if after is not None:
+        comments = comments.filter(path__gt=_after(after))
+    comments = comments.annotate(
+        thread_rank=Window(DenseRank(), order_by=thread.asc()),
+        position=Window(RowNumber(), partition_by=[thread], order_by=F("path").asc()),
+        thread_size=Window(Count("id"), partition_by=[thread]),
+    )
+    # Window functions can't be filtered on directly, so number the rows in
+    # a subquery and filter outside it.
+    sql, params = comments.query.sql_with_params()
+    return list(
+        Comment.objects.raw(
+            f"SELECT * FROM ({sql}) threads"
+            " WHERE thread_rank <= %s AND position <= %s ORDER BY path",
+            (*params, threads, replies + 1),
+        )
+    )
+
+
+def _after(comment_id):
+    return Comment.path_step(comment_id) + PATH_END
+
+
+def select_subtree(comments, comment):
+    """
+    ``subtree()`` of ``comment`` among ``comments``.
+    """
+    return sorted(
+        (
+            reply
+            for reply in comments
+            if comment.path < reply.path < comment.path + PATH_END
+        ),
+        key=attrgetter("path"),
+    )
+
+
+def select_threads(comments, threads, replies, after=None):
+    """
+    ``top_threads()`` among ``comments``.
+    """
+    comments = sorted(comments, key=attrgetter("path"))
+    if after is not None:
+        comments = [comment for comment in comments if comment.path > _after(after)]
+    by_thread = {}
+    for comment in comments:
+        by_thread.setdefault(comment.path[: Comment.PATH_STEP], []).append(comment)
+    selected = []
+    for thread in list(by_thread.values())[:threads]:
+        for comment in thread[: replies + 1]:
+            comment.thread_size = len(thread)
+            selected.append(comment)
+    return selected
+
+
+def nest(rows):
+    """
+    Turn serialized comments in thread order into trees: every row gets
+    its ``replies``, and the rows whose parent isn't among them are
+    returned.
+    """
+    by_id = {}
+    roots = []
+    for row in rows:
+        row["replies"] = []
+        by_id[row["id"]] = row
+        parent = by_id.get(row["parent"])
+        (parent["replies"] if parent else roots).append(row)
+    return roots
@@ -4,6 +4,8 @@ from profile_services.views import (
     ProfileViewSet,
     PostViewSet,
     TagViewSet,
+    ExportView,
+    HomeView,
     # CommentViewSet,
 )
 
@@ -15,6 +17,8 @@ router.register("tag", TagViewSet)
 
 urlpatterns = [
     path("", include(router.urls)),
+    path("export/", ExportView.as_view(), name="export"),
+    path("home/", HomeView.as_view(), name="home"),
 ]
 
 app_name = "profile_services"
@@ -0,0 +1,79 @@
+"""
+Flags relating a row to the requesting user: ``liked_by_me`` on posts and
+``followed_by_me`` on profiles.
+
+A list resolves the flags of all its rows at once, with one ``IN`` query
+against ``Like`` or the follow relation, and keeps them in the request's
+identity map; each row then reads its flag from memory. Anonymous users
+get ``False`` without a query.
+"""
+from profile_services.archive import archived_liked_post_ids
+from profile_services.identity_map import get_identity_map
+from profile_services.models import Like, Profile
+
+LIKED = "liked_by_me"
+FOLLOWED = "followed_by_me"
+
+
+def _viewer_id(request):
+    user = getattr(request, "user", None)
+    if user is None or not user.is_authenticated:
+        return None
+    return user.pk
+
+
+def _prime(request, kind, ids, load):
+    viewer_id = _viewer_id(request)
+    ids = set(ids)
+    if viewer_id is None or not ids:
+        return set()
+
+    identity_map = get_identity_map(request)
+    missing = {pk for pk in ids if identity_map.find((kind, pk)) is None}
+    if missing:
+        found = load(viewer_id, missing)
+        for pk in missing:
+            identity_map.add((kind, pk), pk in found)
+    return {pk for pk in ids if identity_map.find((kind, pk))}
+
+
+def prime_liked(request, post_ids, archived_post_ids=()):
+    """
+    Return the ids among ``post_ids`` of the posts the requesting user
+    likes. ``archived_post_ids`` are the posts with archived likes, which
+    are searched too.
+    """
+
+    def load(viewer_id, missing):
+        liked = set(
+            Like.objects.filter(user_id=viewer_id, post_id__in=missing).values_list(
+                "post_id", flat=True
+            )
+        )
+        candidates = (set(archived_post_ids) & missing) - liked
+        if candidates:
+            liked |= archived_liked_post_ids(candidates, viewer_id)
+        return liked
+
+    return _prime(request, LIKED, post_ids, load)
+
+
+def prime_followed(request, profile_ids):
+    """
+    Return the ids among ``profile_ids`` of the profiles the requesting
+    user follows.
+    """
+
+    def load(viewer_id, missing):
+        return set(
+            Profile.followers.through.objects.filter(
+                user_id=viewer_id, profile_id__in=missing
+            ).values_list("profile_id", flat=True)
+        )
+
+    return _prime(request, FOLLOWED, profile_ids, load)
+
+
+def set_liked(request, post_id, liked):
+    if request is not None:
+        get_identity_map(request).add((LIKED, post_id), liked)
@@ -1,13 +1,48 @@
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
+from django.http import Http404, StreamingHttpResponse
 from rest_framework import viewsets, status, mixins
-from rest_framework.authentication import TokenAuthentication
 from rest_framework.decorators import action
+from rest_framework.generics import get_object_or_404
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
-from django.db.models import F
+from rest_framework.views import APIView
 from rest_framework.viewsets import GenericViewSet
 
+from profile_services.archive import (
+    archived_comments,
+    has_archived_like,
+    remove_archived_like,
+    restore_archived_comment,
+)
+from profile_services.deletion import delete_post, delete_profile
+from profile_services.fast_path import post_list_rows, profile_list_rows
+from profile_services.home import home_screen
+from profile_services.identity_map import (
+    get_identity_map,
+    get_request_profile,
+    object_key,
+    remember,
+)
 from profile_services.models import Profile, Post, Like, Comment, Tag
+from profile_services.ndjson import export_lines
+from profile_services.outbox import publish
 from profile_services.permissions import IsAdminOrIfAuthenticatedReadOnly
+from profile_services.ranking import rank_posts
+from profile_services.tagging import normalize_tag, tag_post
+from profile_services.threads import (
+    MAX_THREAD_REPLIES,
+    MAX_THREADS,
+    nest,
+    select_subtree,
+    select_threads,
+    subtree,
+    top_threads,
+)
 from profile_services.serializers import (
     ProfileSerializer,
     ProfileListSerializer,
@@ -15,25 +50,148 @@ from profile_services.serializers import (
     PostListSerializer,
     LikeSerializer,
     CommentSerializer,
+    CommentThreadSerializer,
     ProfileDetailSerializer,
     ProfileDetailUpdateSerializer,
     PostDetailSerializer,
     FollowUnfollowSerializer,
     TagSerializer,
 )
+from social_media_platform_api.metrics import record_cache
+from social_media_platform_api.pagination import IdCursorPagination
+from social_media_platform_api.throttling import ThrottleFirstMixin, WRITE_THROTTLES
+
+
+class FastListMixin:
+    """
+    Serve ``list`` from plain ``values()`` dicts instead of the list
+    serializer when ``FAST_LIST_SERIALIZATION`` is enabled.
+    """
+
+    fast_list_builder = None
+
+    def serialize_list(self, objects):
+        if getattr(settings, "FAST_LIST_SERIALIZATION", False):
+            return self.fast_list_builder(objects, self.request)
+        return self.get_serializer(objects, many=True).data
+
+    def list(self, request, *args, **kwargs):
+        if not getattr(settings, "FAST_LIST_SERIALIZATION", False):
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        build = self.fast_list_builder
+
+        # The builder reads the rows itself; the page only needs the ids.
+        page = self.paginate_queryset(queryset.prefetch_related(None))
+        if page is not None:
+            return self.get_paginated_response(build(page, request))
+        if self.should_stream():
+            return self.streaming_list_response(queryset)
+        return Response(build(queryset, request))
+
+    def should_stream(self):
+        return getattr(settings, "STREAMING_LISTS", False) and isinstance(
+            self.request.accepted_renderer, JSONRenderer
+        )
+
+    def streaming_list_response(self, queryset):
+        """
+        Render the list as a JSON array, ``STREAMING_LIST_CHUNK_SIZE`` rows
+        at a time, so memory stays flat whatever the number of rows. The
+        bytes are the same as the regular response's.
+        """
+        renderer = self.request.accepted_renderer
+        content_type = renderer.media_type
+        if renderer.charset:
+            content_type = f"{content_type}; charset={renderer.charset}"
+        return StreamingHttpResponse(
+            self.stream_json_array(queryset), content_type=content_type
+        )
 
+    def stream_json_array(self, queryset):
+        chunk_size = settings.STREAMING_LIST_CHUNK_SIZE
+        renderer = self.request.accepted_renderer
+        renderer_context = self.get_renderer_context()
+        objects = (
+            queryset.select_related(None)
+            .prefetch_related(None)
+            .only("id")
+            .iterator(chunk_size=chunk_size)
+        )
 
-class ProfileViewSet(viewsets.ModelViewSet):
+        separator = b"["
+        while True:
+            chunk = list(islice(objects, chunk_size))
+            if not chunk:
+                break
+            with get_identity_map(self.request).scope():
+                rows = self.fast_list_builder(chunk, self.request)
+            # Strip the chunk's own brackets and join the chunks with commas.
+            content = renderer.render(
+                rows, self.request.accepted_media_type, renderer_context
+            )[1:-1]
+            if content:
+                yield separator + content
+                separator = b","
+        yield b"[]" if separator == b"[" else b"]"
+
+
+class IdentityMapMixin:
+    """
+    Load the object behind ``get_object()`` at most once per request, no
+    matter how many times serializer selection, permissions and the action
+    itself ask for it.
+    """
+
+    def get_object(self):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        key = object_key(self.queryset.model, self.kwargs[lookup_url_kwarg])
+        load_object = super().get_object
+
+        def load():
+            obj = load_object()
+            remember(self.request, obj)
+            return obj
+
+        return get_identity_map(self.request).get(key, load)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        identity_map = get_identity_map(request)
+        record_cache("identity_map", identity_map.hits, identity_map.misses)
+        if settings.DEBUG:
+            # Every hit is a query that would otherwise have been run again.
+            response["X-Identity-Map-Saved-Queries"] = identity_map.hits
+        return response
+
+
+def profile_posts():
+    """
+    Prefetch for a profile's posts, newest first, read through the
+    ``(profile, id)`` index.
+    """
+    return Prefetch(
+        "posts",
+        queryset=Post.objects.prefetch_related(
+            "tags", "engagement_segments", "likes", "comments"
+        ).order_by("-id"),
+    )
+
+
+class ProfileViewSet(
+    ThrottleFirstMixin, IdentityMapMixin, FastListMixin, viewsets.ModelViewSet
+):
     queryset = Profile.objects.all()
     serializer_class = ProfileSerializer
-    authentication_classes = (TokenAuthentication,)
     permission_classes = (IsAuthenticated, IsAdminOrIfAuthenticatedReadOnly)
+    fast_list_builder = staticmethod(profile_list_rows)
 
     def get_serializer_class(self):
         if self.action == "list":
             return ProfileListSerializer
         elif self.action == "retrieve":
-            if self.get_object().user == self.request.user:
+            if self.get_object().user_id == self.request.user.id:
                 return ProfileDetailUpdateSerializer
             return ProfileDetailSerializer
         elif self.action in ["follow", "unfollow"]:
@@ -46,43 +204,47 @@ class ProfileViewSet(viewsets.ModelViewSet):
             username = self.request.query_params.get("username")
             if username:
                 queryset = queryset.filter(user__username__icontains=username)
+        elif self.action == "retrieve":
+            # Only the detail serializers render the posts.
+            queryset = queryset.prefetch_related(profile_posts())
         return queryset.distinct()
 
-    def perform_create(self, serializer):
-        user = self.request.user
-
-        profile = serializer.save(user=user)
-
-        posts = Post.objects.filter(user=user)
-        posts.update(profile=profile)
-
-        profile.posts_count = F("posts_count") + posts.count()
-        profile.save()
+    def perform_destroy(self, instance):
+        # Hidden now; reap_deletions removes the rows in the background.
+        delete_profile(instance)
 
     def get_permissions(self):
         if self.action in ["create", "list", "follow", "unfollow"]:
             return []
         return super().get_permissions()
 
-    @action(detail=True, methods=["post"])
+    @action(
+        detail=True,
+        methods=["post"],
+        throttle_classes=WRITE_THROTTLES,
+        throttle_scope="follow",
+    )
     def follow(self, request, pk=None):
         profile = self.get_object()
         user = request.user
 
-        if profile.user == user:
+        if profile.user_id == user.id:
             return Response(
                 {"detail": "You cannot follow your own profile."},
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        profile.followers.add(user)
-        profile.save()
+        user_profile = get_request_profile(request)
+        with transaction.atomic():
+            profile.followers.add(user)
+            profile.save()
 
-        user_profile = user.profile
-        user_profile.following.add(profile.user)
-        user_profile.save()
+            user_profile.following.add(profile.user_id)
+            user_profile.save()
+            publish("profile.followed", profile_id=profile.id, user_id=user.id)
 
         profile_serializer = self.get_serializer(profile)
+        prefetch_related_objects([user_profile], profile_posts())
         user_profile_serializer = ProfileDetailSerializer(user_profile)
         return Response(
             {
@@ -99,11 +261,12 @@ class ProfileViewSet(viewsets.ModelViewSet):
         profile.followers.remove(user)
         profile.save()
 
-        user_profile = user.profile
-        user_profile.following.remove(profile.user)
+        user_profile = get_request_profile(request)
+        user_profile.following.remove(profile.user_id)
         user_profile.save()
 
         profile_serializer = self.get_serializer(profile)
+        prefetch_related_objects([user_profile], profile_posts())
         user_profile_serializer = ProfileDetailSerializer(user_profile)
         return Response(
             {
@@ -120,33 +283,46 @@ class TagViewSet(
 ):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
-    authentication_classes = (TokenAuthentication,)
     permission_classes = (IsAuthenticated, IsAdminOrIfAuthenticatedReadOnly)
 
 
-class PostViewSet(viewsets.ModelViewSet):
-    queryset = Post.objects.prefetch_related("tags")
+class PostViewSet(
+    ThrottleFirstMixin, IdentityMapMixin, FastListMixin, viewsets.ModelViewSet
+):
+    queryset = Post.objects.prefetch_related("tags", "engagement_segments").order_by(
+        "-id"
+    )
+    pagination_class = IdCursorPagination
     serializer_class = PostSerializer
-    authentication_classes = (TokenAuthentication,)
     permission_classes = (IsAuthenticated, IsAdminOrIfAuthenticatedReadOnly)
+    fast_list_builder = staticmethod(post_list_rows)
 
     def get_queryset(self):
         tags = self.request.query_params.get("tags")
 
-        queryset = self.queryset
+        queryset = super().get_queryset()
 
         if tags:
-            queryset = queryset.filter(tags__name__icontains=tags)
+            # A subquery keeps each post once when several of its tags match
+            # and lets the feed be read in primary-key order.
+            queryset = queryset.filter(
+                id__in=Post.tags.through.objects.filter(
+                    tag__name__icontains=tags
+                ).values("post_id")
+            )
+        if self.action in ("list", "feed", "retrieve"):
+            # LikeRepresentationMixin counts the likes and names the first.
+            queryset = queryset.prefetch_related("likes")
 
         return queryset
 
     def get_serializer_class(self):
-        if self.action == "list":
+        if self.action in ("list", "feed"):
             return PostListSerializer
 
         elif self.action == "retrieve":
             post = self.get_object()
-            if post.user == self.request.user:
+            if post.user_id == self.request.user.id:
                 return PostSerializer
             else:
                 return PostDetailSerializer
@@ -154,6 +330,9 @@ class PostViewSet(viewsets.ModelViewSet):
         elif self.action == "add_comment":
             return CommentSerializer
 
+        elif self.action == "comments":
+            return CommentThreadSerializer
+
         elif self.action in ["add_like", "remove_like"]:
             return LikeSerializer
 
@@ -162,24 +341,68 @@ class PostViewSet(viewsets.ModelViewSet):
 
         return super().get_serializer_class()
 
-    def perform_create(self, serializer):
-        post = serializer.save(user=self.request.user)
-        profile = Profile.objects.get(user=self.request.user)
-        profile.posts.add(post)
+    def list_source(self, queryset):
+        if getattr(settings, "FAST_LIST_SERIALIZATION", False):
+            # The fast path reads the rows itself; only ids and order count.
+            return queryset.prefetch_related(None).only("id")
+        return queryset
 
-    @action(detail=True, methods=["post"])
+    def ranked_response(self, queryset):
+        ids = rank_posts(queryset, self.request.user)
+        posts = self.list_source(queryset).in_bulk(ids)
+        return Response(self.serialize_list([posts[pk] for pk in ids if pk in posts]))
+
+    def list(self, request, *args, **kwargs):
+        if request.query_params.get("ranked") == "1":
+            return self.ranked_response(self.filter_queryset(self.get_queryset()))
+        return super().list(request, *args, **kwargs)
+
+    @action(detail=False, methods=["get"])
+    def feed(self, request):
+        """
+        Posts of the profiles the user follows, newest first, or ranked for
+        the user with ``?ranked=1``.
+        """
+        following = Profile.following.through.objects.filter(
+            profile__user_id=request.user.id
+        ).values("user_id")
+        queryset = self.filter_queryset(self.get_queryset()).filter(
+            user_id__in=following
+        )
+        if request.query_params.get("ranked") == "1":
+            return self.ranked_response(queryset)
+        posts = list(self.list_source(queryset)[: settings.FEED_CANDIDATES])
+        return Response(self.serialize_list(posts))
+
+    def perform_create(self, serializer):
+        with transaction.atomic():
+            post = serializer.save()
+            publish("post.created", post_id=post.id, user_id=post.user_id)
+
+    def perform_destroy(self, instance):
+        # Hidden now; reap_deletions removes the rows in the background.
+        delete_post(instance)
+
+    @action(
+        detail=True,
+        methods=["post"],
+        throttle_classes=WRITE_THROTTLES,
+        throttle_scope="add_like",
+    )
     def add_like(self, request, pk=None):
         post = self.get_object()
         user = request.user
 
-        if post.likes.filter(user=user).exists():
+        if post.likes.filter(user=user).exists() or has_archived_like(post, user.id):
             return Response(
                 {"detail": "You have already liked this post."},
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        like = Like.objects.create(user=user, post=post)
-        post.likes.add(like)
+        with transaction.atomic():
+            like = Like.objects.create(user=user, post=post)
+            post.likes.add(like)
+            publish("like.created", like_id=like.id, post_id=post.id, user_id=user.id)
 
         return Response({"detail": "You liked this post"}, status=status.HTTP_200_OK)
 
@@ -196,34 +419,162 @@ class PostViewSet(viewsets.ModelViewSet):
                 {"detail": "You unlike this post"}, status=status.HTTP_200_OK
             )
         except Like.DoesNotExist:
+            if remove_archived_like(post, user.id):
+                return Response(
+                    {"detail": "You unlike this post"}, status=status.HTTP_200_OK
+                )
             return Response(
                 {"detail": "You have not liked this post."},
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-    @action(detail=True, methods=["post"])
+    @action(
+        detail=True,
+        methods=["post"],
+        throttle_classes=WRITE_THROTTLES,
+        throttle_scope="add_comment",
+    )
     def add_comment(self, request, pk=None):
+        """
+        Comment on the post, or reply to one of its comments with
+        ``parent``.
+        """
         post = self.get_object()
         user = request.user
 
+        parent = None
+        parent_id = request.data.get("parent")
+        if parent_id:
+            try:
+                parent_id = int(parent_id)
+            except (TypeError, ValueError):
+                parent_id = None
+            else:
+                parent = (
+                    Comment.objects.only("id", "post_id", "path")
+                    .filter(pk=parent_id, post=post)
+                    .first()
+                )
+                if parent is None:
+                    # Replies to an archived comment bring its thread back.
+                    parent = restore_archived_comment(post, parent_id)
+            if parent is None:
+                return Response(
+                    {"detail": "Reply to a comment of this post."},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            if parent.depth >= Comment.MAX_DEPTH:
+                return Response(
+                    {"detail": "This thread is nested too deeply."},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+
         comment_content = request.data.get("content", "")
-        comment = Comment.objects.create(user=user, post=post, content=comment_content)
-        post.comments.add(comment)
+        with transaction.atomic():
+            comment = Comment.objects.create(
+                user=user, post=post, parent=parent, content=comment_content
+            )
+            post.comments.add(comment)
+            publish(
+                "comment.created",
+                comment_id=comment.id,
+                post_id=post.id,
+                user_id=user.id,
+                parent_id=comment.parent_id,
+            )
         return Response(
             {"detail": "You leave a comment on this post"}, status=status.HTTP_200_OK
         )
 
+    @action(detail=True, methods=["get"])
+    def comments(self, request, pk=None):
+        """
+        The post's comment threads, oldest first: up to ``threads``
+        top-level comments after the one with id ``after``, each with its
+        first ``replies`` replies nested under their parents. With
+        ``parent``, all the replies to that comment instead.
+        """
+        post = self.get_object()
+        params = request.query_params
+
+        try:
+            parent_id = int(params["parent"]) if params.get("parent") else None
+            after = int(params["after"]) if params.get("after") else None
+            threads = min(int(params.get("threads", 20)), MAX_THREADS)
+            replies = min(int(params.get("replies", 3)), MAX_THREAD_REPLIES)
+        except ValueError:
+            return Response(
+                {"detail": "parent, after, threads and replies must be integers."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        archived = archived_comments(post)
+        if archived:
+            # Threads run through the archive: read all the comments.
+            comments = archived + list(Comment.objects.filter(post=post))
+            if parent_id is not None:
+                parent = next(
+                    (comment for comment in comments if comment.pk == parent_id), None
+                )
+                if parent is None:
+                    raise Http404
+                comments = select_subtree(comments, parent)
+            else:
+                comments = select_threads(
+                    comments, max(threads, 0), max(replies, 0), after
+                )
+        elif parent_id is not None:
+            parent = get_object_or_404(
+                Comment.objects.only("id", "post_id", "path"), pk=parent_id, post=post
+            )
+            comments = subtree(parent)
+        else:
+            comments = top_threads(post.id, max(threads, 0), max(replies, 0), after)
+        data = nest(self.get_serializer(comments, many=True).data)
+        if parent_id is None:
+            sizes = {str(comment.id): comment.thread_size for comment in comments}
+            for thread in data:
+                thread["reply_count"] = sizes[thread["id"]] - 1
+        return Response(data)
+
     @action(detail=True, methods=["post"])
     def add_tag(self, request, pk=None):
         post = self.get_object()
 
-        tag_name = request.data.get("name", "")
-        tag = Tag.objects.create(post=post, name=tag_name)
+        tag_name = normalize_tag(request.data.get("name", ""))
+        if not tag_name:
+            return Response(
+                {"detail": "Tag name is required."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
 
-        post.tags.add(tag)
+        tag_post(post, [tag_name])
         return Response({"detail": "Tag added to the post"}, status=status.HTTP_200_OK)
 
     def get_permissions(self):
         if self.action in ["create", "list", "add_like", "remove_like"]:
             return []
         return super().get_permissions()
+
+
+class ExportView(APIView):
+    permission_classes = (IsAuthenticated,)
+
+    def get(self, request):
+        response = StreamingHttpResponse(
+            export_lines(request.user), content_type="application/x-ndjson"
+        )
+        response["Content-Disposition"] = 'attachment; filename="export.ndjson"'
+        return response
+
+
+class HomeView(APIView):
+    """
+    Everything the app shows on launch: the user and their profile, the
+    first page of their feed, unread counters and trending tags.
+    """
+
+    permission_classes = (IsAuthenticated,)
+
+    def get(self, request):
+        return Response(home_screen(request))
@@ -0,0 +1,3 @@
+from social_media_platform_api.celery import app as celery_app
+
+__all__ = ("celery_app",)
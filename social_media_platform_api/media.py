@@ -0,0 +1,146 @@
+"""
+Media file serving for production.
+
+Files are handed to the front-end server through ``X-Accel-Redirect`` when
+``MEDIA_ACCEL_REDIRECT_PREFIX`` is set (an nginx ``internal`` location
+aliased to ``MEDIA_ROOT``). Otherwise they are returned as ``FileResponse``s,
+which WSGI servers with ``wsgi.file_wrapper`` (gunicorn) send with
+``sendfile()``. Both paths answer conditional requests from a strong ETag
+and ``Last-Modified``, and the Python path also serves single byte ranges.
+"""
+import mimetypes
+import os
+import re
+import stat
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import (
+    FileResponse,
+    Http404,
+    HttpResponse,
+    StreamingHttpResponse,
+)
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+
+# post_image_file_path / profile_image_file_path put a fresh uuid4 in every
+# stored name, so those files never change once written.
+IMMUTABLE_NAME = re.compile(
+    r"-[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\.[^/]*$"
+)
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+DEFAULT_CACHE_CONTROL = "public, no-cache"
+
+RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+CHUNK_SIZE = 64 * 1024
+
+
+def _etag(file_stat):
+    return f'"{file_stat.st_ino:x}-{file_stat.st_size:x}-{file_stat.st_mtime_ns:x}"'
+
+
+def _requested_range(request, size, etag, last_modified):
+    """
+    Return ``(start, end)`` for a satisfiable single-range request, ``None``
+    to serve the whole file, or ``False`` for an unsatisfiable range.
+    """
+    header = request.META.get("HTTP_RANGE")
+    if not header:
+        return None
+
+    if_range = request.META.get("HTTP_IF_RANGE")
+    if if_range and if_range != etag:
+        if_range_date = parse_http_date_safe(if_range)
+        if if_range_date is None or if_range_date < last_modified:
+            return None
+
+    match = RANGE.match(header.strip())
+    if not match or match.groups() == ("", ""):
+        # Multiple or malformed ranges: ignoring the header is allowed.
+        return None
+
+    first, last = match.groups()
+    if first and last and int(last) < int(first):
+        # Invalid, not unsatisfiable: RFC 9110 says to ignore it.
+        return None
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    else:
+        start = max(size - int(last), 0)
+        end = size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def _read_range(path, start, length):
+    with open(path, "rb") as media_file:
+        media_file.seek(start)
+        while length > 0:
+            chunk = media_file.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                return
+            length -= len(chunk)
+            yield chunk
+
+
+def serve_media(request, path):
+    try:
+        fullpath = safe_join(settings.MEDIA_ROOT, path)
+        file_stat = os.stat(fullpath)
+    except (OSError, ValueError):
+        raise Http404("Media file not found")
+    if not stat.S_ISREG(file_stat.st_mode):
+        raise Http404("Media file not found")
+
+    etag = _etag(file_stat)
+    last_modified = int(file_stat.st_mtime)
+    cache_control = (
+        IMMUTABLE_CACHE_CONTROL
+        if IMMUTABLE_NAME.search(path)
+        else DEFAULT_CACHE_CONTROL
+    )
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        content_type = mimetypes.guess_type(fullpath)[0] or "application/octet-stream"
+        accel_prefix = getattr(settings, "MEDIA_ACCEL_REDIRECT_PREFIX", None)
+        byte_range = _requested_range(request, file_stat.st_size, etag, last_modified)
+
+        if accel_prefix:
+            # The front-end server handles ranges itself.
+            response = HttpResponse(content_type=content_type)
+            response["X-Accel-Redirect"] = accel_prefix + quote(path)
+        elif byte_range is False:
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{file_stat.st_size}"
+        elif byte_range is None:
+            response = FileResponse(open(fullpath, "rb"), content_type=content_type)
+        else:
+            start, end = byte_range
+            length = end - start + 1
+            if end == file_stat.st_size - 1:
+                # An open-ended range can still go out through sendfile().
+                media_file = open(fullpath, "rb")
+                media_file.seek(start)
+                response = FileResponse(
+                    media_file, status=206, content_type=content_type
+                )
+            else:
+                response = StreamingHttpResponse(
+                    _read_range(fullpath, start, length),
+                    status=206,
+                    content_type=content_type,
+                )
+            response["Content-Length"] = str(length)
+            response["Content-Range"] = f"bytes {start}-{end}/{file_stat.st_size}"
+
+        response["Accept-Ranges"] = "bytes"
+
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    response["Cache-Control"] = cache_control
+    return response
@@ -0,0 +1,425 @@
+"""
+In-process metrics, exposed in the Prometheus text format at ``/metrics``.
+
+Every process keeps its values in its own memory-mapped file in
+``METRICS_DIR`` (``metrics_<pid>.db``); an update is a dict lookup and a
+``struct.pack_into``. ``/metrics`` adds up the files of all processes, so
+any worker answers for the whole server. Without ``METRICS_DIR`` values
+live in a dict and only cover the answering process. ``gunicorn.conf.py``
+points every worker at one fresh directory, and calls
+``mark_process_dead()`` for workers that exit, so their gauges stop
+counting while their counters still do.
+
+``MetricsMiddleware`` records per route and per action (``PostViewSet.
+add_like``): requests by method and status, a latency histogram and the
+number of database queries, plus the requests in flight. A streamed
+response is measured until its body has been sent, or until it is closed
+unread. Caches report
+their hits and misses through ``cache_requests``.
+"""
+import glob
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+
+INITIAL_FILE_SIZE = 1 << 20
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class FileStore:
+    """
+    ``key -> float`` for one process, in a file of ``[length][key][value]``
+    entries, each value 8-byte aligned, after an 8-byte header holding the
+    bytes in use.
+    """
+
+    def __init__(self, path):
+        self._file = open(path, "a+b")
+        if os.fstat(self._file.fileno()).st_size == 0:
+            self._file.truncate(INITIAL_FILE_SIZE)
+        self._map = mmap.mmap(self._file.fileno(), 0)
+        self._positions = {}
+        for key, position in self.read_positions(self._map):
+            self._positions[key] = position
+        self._used = struct.unpack_from("i", self._map, 0)[0] or 8
+
+    @staticmethod
+    def read_positions(data):
+        used = struct.unpack_from("i", data, 0)[0] or 8
+        offset = 8
+        while offset < used:
+            length = struct.unpack_from("i", data, offset)[0]
+            padded = length + (-(length + 4) % 8)
+            key = data[offset + 4 : offset + 4 + length].decode()
+            offset += 4 + padded
+            yield key, offset
+            offset += 8
+
+    @classmethod
+    def read(cls, path):
+        with open(path, "rb") as file:
+            data = file.read()
+        if not data:
+            return {}
+        return {
+            key: struct.unpack_from("d", data, position)[0]
+            for key, position in cls.read_positions(data)
+        }
+
+    def _add_key(self, key):
+        encoded = key.encode()
+        padded = encoded + b" " * (-(len(encoded) + 4) % 8)
+        entry = struct.pack(f"i{len(padded)}sd", len(encoded), padded, 0.0)
+        if self._used + len(entry) > len(self._map):
+            size = max(2 * len(self._map), self._used + len(entry))
+            self._map.close()
+            self._file.truncate(size)
+            self._map = mmap.mmap(self._file.fileno(), 0)
+        self._map[self._used : self._used + len(entry)] = entry
+        position = self._used + 4 + len(padded)
+        self._used += len(entry)
+        struct.pack_into("i", self._map, 0, self._used)
+        self._positions[key] = position
+        return position
+
+    def add(self, key, amount):
+        position = self._positions.get(key)
+        if position is None:
+            position = self._add_key(key)
+        value = struct.unpack_from("d", self._map, position)[0]
+        struct.pack_into("d", self._map, position, value + amount)
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+
+class MemoryStore(dict):
+    def add(self, key, amount):
+        self[key] = self.get(key, 0.0) + amount
+
+
+_lock = threading.Lock()
+_store = None
+_store_pid = None
+
+
+def _metrics_dir():
+    return getattr(settings, "METRICS_DIR", None)
+
+
+def _get_store():
+    global _store, _store_pid
+    # A forked worker writes its own file, not its parent's.
+    if _store_pid != os.getpid():
+        directory = _metrics_dir()
+        if directory:
+            _store = FileStore(os.path.join(directory, f"metrics_{os.getpid()}.db"))
+        else:
+            _store = MemoryStore()
+        _store_pid = os.getpid()
+    return _store
+
+
+def _add(key, amount):
+    with _lock:
+        _get_store().add(key, amount)
+
+
+def mark_process_dead(pid, directory=None):
+    """
+    Zero the gauges in the file of a process that exited: the requests it
+    was handling are no longer in flight. A new process that is given the
+    same pid starts from zero too.
+    """
+    path = os.path.join(directory or _metrics_dir(), f"metrics_{pid}.db")
+    if not os.path.exists(path):
+        return
+    gauges = {metric.name for metric in REGISTRY if metric.kind == "gauge"}
+    store = FileStore(path)
+    try:
+        for key, value in FileStore.read(path).items():
+            if value and json.loads(key)[0] in gauges:
+                store.add(key, -value)
+    finally:
+        store.close()
+
+
+def _collect():
+    directory = _metrics_dir()
+    if not directory:
+        with _lock:
+            return dict(_get_store())
+
+    totals = defaultdict(float)
+    for path in glob.glob(os.path.join(directory, "metrics_*.db")):
+        for key, value in FileStore.read(path).items():
+            totals[key] += value
+    return totals
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._keys = {}
+        REGISTRY.append(self)
+
+    def _key(self, labels, suffix=""):
+        cache_key = (labels, suffix)
+        key = self._keys.get(cache_key)
+        if key is None:
+            key = self._keys[cache_key] = json.dumps([self.name + suffix, list(labels)])
+        return key
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, labels=(), amount=1):
+        _add(self._key(labels), amount)
+
+
+class Gauge(Metric):
+    """Summed over processes."""
+
+    kind = "gauge"
+
+    def inc(self, labels=(), amount=1):
+        _add(self._key(labels), amount)
+
+    def dec(self, labels=(), amount=1):
+        _add(self._key(labels), -amount)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = buckets
+
+    def observe(self, labels, value):
+        # Only the first matching bucket is stored; exposition makes the
+        # counts cumulative.
+        for bucket in self.buckets:
+            if value <= bucket:
+                break
+        else:
+            bucket = "+Inf"
+        with _lock:
+            store = _get_store()
+            store.add(self._key(labels + (str(bucket),), "_bucket"), 1)
+            store.add(self._key(labels, "_sum"), value)
+            store.add(self._key(labels, "_count"), 1)
+
+
+REGISTRY = []
+
+requests_total = Counter(
+    "http_requests_total",
+    "Requests by route, action, method and status.",
+    ("route", "action", "method", "status"),
+)
+request_duration = Histogram(
+    "http_request_duration_seconds",
+    "Time spent in the view by route and action.",
+    ("route", "action"),
+)
+db_queries_total = Counter(
+    "db_queries_total",
+    "Database queries run by the view, by route and action.",
+    ("route", "action"),
+)
+requests_in_flight = Gauge(
+    "http_requests_in_flight", "Requests being handled right now."
+)
+cache_requests = Counter(
+    "cache_requests_total", "Cache lookups by cache and result.", ("cache", "result")
+)
+
+
+def record_cache(cache, hits, misses):
+    if hits:
+        cache_requests.inc((cache, "hit"), hits)
+    if misses:
+        cache_requests.inc((cache, "miss"), misses)
+
+
+def _escape(value):
+    return value.replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+
+
+def _labels(names, values):
+    return ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+
+
+def _sample(name, label_text, value):
+    value = float(value)
+    number = str(int(value)) if value.is_integer() else repr(value)
+    if label_text:
+        return f"{name}{{{label_text}}} {number}"
+    return f"{name} {number}"
+
+
+def render():
+    values = defaultdict(dict)
+    for key, value in _collect().items():
+        name, labels = json.loads(key)
+        values[name][tuple(labels)] = value
+
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        if metric.kind != "histogram":
+            for labels, value in sorted(values[metric.name].items()):
+                lines.append(
+                    _sample(metric.name, _labels(metric.labelnames, labels), value)
+                )
+            continue
+
+        buckets = values[metric.name + "_bucket"]
+        for labels, total in sorted(values[metric.name + "_count"].items()):
+            label_text = _labels(metric.labelnames, labels)
+            cumulative = 0
+            for bucket in metric.buckets + ("+Inf",):
+                cumulative += buckets.get(labels + (str(bucket),), 0)
+                lines.append(
+                    _sample(
+                        f"{metric.name}_bucket",
+                        f'{label_text},le="{bucket}"',
+                        cumulative,
+                    )
+                )
+            lines.append(
+                _sample(
+                    f"{metric.name}_sum",
+                    label_text,
+                    values[metric.name + "_sum"].get(labels, 0),
+                )
+            )
+            lines.append(_sample(f"{metric.name}_count", label_text, total))
+    return "\n".join(lines) + "\n"
+
+
+def metrics_view(request):
+    token = getattr(settings, "METRICS_TOKEN", None)
+    if not token:
+        # Routes, actions and traffic are not for everyone to read.
+        if not settings.DEBUG:
+            return HttpResponseForbidden()
+    elif not constant_time_compare(
+        request.META.get("HTTP_AUTHORIZATION", ""), f"Bearer {token}"
+    ):
+        return HttpResponseForbidden()
+    return HttpResponse(render(), content_type="text/plain; version=0.0.4")
+
+
+_actions = {}
+
+
+def _action(resolver_match, method):
+    """
+    ``PostViewSet.add_like`` for viewsets, ``View.get`` for class-based
+    views, the function name otherwise.
+    """
+    if resolver_match is None:
+        return "unmatched"
+    func = resolver_match.func
+    key = (func, method)
+    action = _actions.get(key)
+    if action is None:
+        view_class = getattr(func, "cls", None) or getattr(func, "view_class", None)
+        actions = getattr(func, "actions", None) or {}
+        if view_class is not None:
+            handler = actions.get(method.lower(), method.lower())
+            action = f"{view_class.__name__}.{handler}"
+        else:
+            action = f"{func.__module__}.{func.__name__}"
+        _actions[key] = action
+    return action
+
+
+class _QueryCounter:
+    __slots__ = ("count",)
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class MetricsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = _QueryCounter()
+        requests_in_flight.inc()
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(queries):
+                response = self.get_response(request)
+        except BaseException:
+            requests_in_flight.dec()
+            raise
+
+        finished = False
+
+        def finish():
+            nonlocal finished
+            if finished:
+                return
+            finished = True
+            requests_in_flight.dec()
+            duration = time.perf_counter() - started
+            resolver_match = request.resolver_match
+            route = resolver_match.route if resolver_match is not None else ""
+            labels = (route, _action(resolver_match, request.method))
+            requests_total.inc(labels + (request.method, str(response.status_code)))
+            request_duration.observe(labels, duration)
+            if queries.count:
+                db_queries_total.inc(labels, queries.count)
+
+        if response.streaming:
+            # Streamed lists query and render as the server reads the body.
+            response.streaming_content = _measure_stream(
+                response.streaming_content, queries, finish
+            )
+            # The server closes the response even if it never reads the
+            # body, in which case the generator above never runs.
+            close = response.close
+
+            def close_and_finish():
+                try:
+                    close()
+                finally:
+                    finish()
+
+            response.close = close_and_finish
+        else:
+            finish()
+        return response
+
+
+def _measure_stream(content, queries, finish):
+    try:
+        with connection.execute_wrapper(queries):
+            yield from content
+    finally:
+        finish()
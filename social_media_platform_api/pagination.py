@@ -0,0 +1,23 @@
+from rest_framework.pagination import CursorPagination
+
+
+class IdCursorPagination(CursorPagination):
+    """
+    Opt-in keyset pagination, newest first, over the time-ordered primary
+    key, so every page is a range read of the primary-key index. Lists
+    stay unpaginated unless the request passes ``?page_size=`` or follows
+    a ``?cursor=`` link.
+    """
+
+    ordering = "-id"
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 500
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if (
+            self.cursor_query_param not in request.query_params
+            and self.page_size_query_param not in request.query_params
+        ):
+            return None
+        return super().paginate_queryset(queryset, request, view)
@@ -0,0 +1,163 @@
+"""
+On-demand sampling profiler.
+
+A staff user profiles one request by sending ``X-Profile: 1`` or adding
+``?_profile=1``. While the view runs, a background thread samples the
+request thread's Python stack every ``PROFILER_INTERVAL_SECONDS`` and
+counts identical stacks. The result is stored as a ``ProfilerCapture`` in
+the collapsed format of ``flamegraph.pl`` and speedscope (``frame;frame;
+frame count`` per line), and its id is returned in ``X-Profile-Id``. Staff
+download captures from the admin.
+
+Requests without the flag only pay for the flag check. The sampler
+covers the view, not the iteration of streaming responses.
+"""
+import functools
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+PROFILE_HEADER = "HTTP_X_PROFILE"
+PROFILE_PARAM = "_profile"
+
+
+@functools.lru_cache(maxsize=4096)
+def _short_filename(filename):
+    for prefix in sorted((path for path in sys.path if path), key=len, reverse=True):
+        if filename.startswith(prefix + os.sep):
+            return filename[len(prefix) + 1 :]
+    return filename
+
+
+def _collapse(frame):
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(f"{_short_filename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(stack))
+
+
+# The switch interval is process-wide, and samplers of concurrent requests
+# overlap: the first one saves it and the last one restores it.
+_switch_lock = threading.Lock()
+_running_samplers = 0
+_saved_switch_interval = None
+
+
+def _shorten_switch_interval(interval):
+    global _running_samplers, _saved_switch_interval
+    with _switch_lock:
+        if not _running_samplers:
+            _saved_switch_interval = sys.getswitchinterval()
+        _running_samplers += 1
+        sys.setswitchinterval(min(sys.getswitchinterval(), interval))
+
+
+def _restore_switch_interval():
+    global _running_samplers
+    with _switch_lock:
+        _running_samplers -= 1
+        if not _running_samplers:
+            sys.setswitchinterval(_saved_switch_interval)
+
+
+class Sampler:
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[_collapse(frame)] += 1
+
+    def __enter__(self):
+        # The sampler needs the GIL on time; by default the request thread
+        # gives it up only every 5ms.
+        _shorten_switch_interval(self.interval / 5)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        _restore_switch_interval()
+
+    @property
+    def sample_count(self):
+        return sum(self.stacks.values())
+
+    def collapsed(self):
+        return "".join(
+            f"{stack} {count}\n" for stack, count in self.stacks.most_common()
+        )
+
+
+def _staff_user(request):
+    """
+    The requesting user if they are staff, else ``None``.
+    """
+    if request.user.is_authenticated:
+        return request.user if request.user.is_staff else None
+
+    # Token users are only known to DRF; authenticate the way the view will.
+    drf_request = Request(
+        request,
+        authenticators=[
+            authentication()
+            for authentication in api_settings.DEFAULT_AUTHENTICATION_CLASSES
+        ],
+    )
+    try:
+        user = drf_request.user
+    except APIException:
+        return None
+    return user if user.is_staff else None
+
+
+class SamplingProfilerMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not (request.META.get(PROFILE_HEADER) or PROFILE_PARAM in request.GET):
+            return self.get_response(request)
+        user = _staff_user(request)
+        if user is None:
+            return self.get_response(request)
+
+        sampler = Sampler(threading.get_ident(), settings.PROFILER_INTERVAL_SECONDS)
+        started = time.perf_counter()
+        with sampler:
+            response = self.get_response(request)
+        duration = time.perf_counter() - started
+
+        capture = self.save(request, user, response, sampler, duration)
+        response["X-Profile-Id"] = str(capture.pk)
+        return response
+
+    def save(self, request, user, response, sampler, duration):
+        from profile_services.models import ProfilerCapture
+
+        return ProfilerCapture.objects.create(
+            user_id=user.pk,
+            method=request.method,
+            path=request.get_full_path(),
+            status_code=response.status_code,
+            duration_ms=duration * 1000,
+            interval_ms=sampler.interval * 1000,
+            sample_count=sampler.sample_count,
+            data=ProfilerCapture.pack(sampler.collapsed()),
+        )
@@ -0,0 +1,130 @@
+"""
+OpenAPI schema served from a precomputed copy.
+
+The schema only changes when the code does, so each rendering (YAML, JSON,
+...) is generated once per code version and kept in memory. With
+``SCHEMA_CACHE_DIR`` set, renderings are also written there, so other worker
+processes and later deploys of the same code load the file instead of
+introspecting every viewset again; ``manage.py build_schema`` fills the
+directory at build time. The code version is ``CODE_VERSION`` when set,
+otherwise a hash of the project's Python sources.
+"""
+import hashlib
+import os
+import threading
+from pathlib import Path
+
+import drf_spectacular
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from drf_spectacular.settings import spectacular_settings
+from drf_spectacular.views import SpectacularAPIView
+
+SOURCE_PACKAGES = ("social_media_platform_api", "profile_services", "user")
+
+_rendered = {}
+_lock = threading.Lock()
+_code_version = None
+
+
+def code_version():
+    global _code_version
+    if _code_version is None:
+        version = getattr(settings, "CODE_VERSION", None)
+        if not version:
+            digest = hashlib.sha256(
+                f"{drf_spectacular.__version__}:{spectacular_settings.VERSION}".encode()
+            )
+            for package in SOURCE_PACKAGES:
+                for source in sorted((Path(settings.BASE_DIR) / package).rglob("*.py")):
+                    digest.update(source.read_bytes())
+            version = digest.hexdigest()[:16]
+        _code_version = version
+    return _code_version
+
+
+def _cache_path(key):
+    cache_dir = getattr(settings, "SCHEMA_CACHE_DIR", None)
+    if not cache_dir:
+        return None
+    name = hashlib.sha256(repr(key).encode()).hexdigest()[:24]
+    return Path(cache_dir) / f"schema-{name}"
+
+
+def get_rendered_schema(renderer, media_type, generate, api_version=None, lang=None):
+    """
+    Return ``(content, etag)`` for the schema rendered by ``renderer`` as
+    ``media_type``. ``generate()`` builds the schema dict and is only
+    called when neither memory nor ``SCHEMA_CACHE_DIR`` has this rendering
+    for the current code version.
+    """
+    key = (code_version(), api_version, lang, media_type)
+    if key in _rendered:
+        return _rendered[key]
+
+    with _lock:
+        if key in _rendered:
+            return _rendered[key]
+
+        path = _cache_path(key)
+        if path is not None and path.exists():
+            content = path.read_bytes()
+        else:
+            content = renderer.render(generate(), media_type, {})
+            if path is not None:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+                tmp_path.write_bytes(content)
+                os.replace(tmp_path, path)
+
+        etag = f'"{hashlib.sha256(content).hexdigest()[:32]}"'
+        _rendered[key] = content, etag
+        return _rendered[key]
+
+
+class CachedSpectacularAPIView(SpectacularAPIView):
+    def _get_schema_response(self, request):
+        version = (
+            self.api_version or request.version or self._get_version_parameter(request)
+        )
+        lang = request.GET.get("lang") if settings.USE_I18N else None
+
+        def generate():
+            generator = self.generator_class(
+                urlconf=self.urlconf, api_version=version, patterns=self.patterns
+            )
+            return generator.get_schema(request=None, public=self.serve_public)
+
+        renderer = request.accepted_renderer
+        content, etag = get_rendered_schema(
+            renderer, request.accepted_media_type, generate, version, lang
+        )
+
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            content_type = request.accepted_media_type
+            if renderer.charset:
+                content_type = f"{content_type}; charset={renderer.charset}"
+            response = HttpResponse(content, content_type=content_type)
+            filename = self._get_filename(request, version)
+            response["Content-Disposition"] = f'inline; filename="{filename}"'
+        response["ETag"] = etag
+        return response
+
+
+def prerender_schema():
+    """
+    Render the default schema in every format the schema view offers.
+    """
+    schema = None
+
+    def generate():
+        nonlocal schema
+        if schema is None:
+            generator = spectacular_settings.DEFAULT_GENERATOR_CLASS()
+            schema = generator.get_schema(request=None, public=True)
+        return schema
+
+    for renderer_class in CachedSpectacularAPIView.renderer_classes:
+        get_rendered_schema(renderer_class(), renderer_class.media_type, generate)
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 import os
+from datetime import timedelta
 from pathlib import Path
 
 from dotenv import load_dotenv
@@ -50,11 +51,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "social_media_platform_api.metrics.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "social_media_platform_api.profiler.SamplingProfilerMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -92,6 +95,28 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+
+if os.environ.get("REDIS_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.environ["REDIS_URL"],
+        }
+    }
+
+# Token buckets for the write throttles live here; anything but Redis means a
+# per-process bucket store.
+THROTTLE_CACHE = "default"
+
+# Profile cards (username, avatar and counts of a user) are cached here. A
+# change drops the card from this cache only, so with a per-process cache
+# other workers serve it stale for up to PROFILE_CARD_TIMEOUT seconds.
+PROFILE_CARD_CACHE = "default"
+PROFILE_CARD_TIMEOUT = 300
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -131,6 +156,10 @@ STATIC_URL = "static/"
 MEDIA_ROOT = BASE_DIR / "media"
 MEDIA_URL = "/media/"
 
+# When set (e.g. "/protected-media/"), media requests are answered with an
+# X-Accel-Redirect to this nginx internal location instead of the file body.
+MEDIA_ACCEL_REDIRECT_PREFIX = os.environ.get("MEDIA_ACCEL_REDIRECT_PREFIX")
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
@@ -138,14 +167,140 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 AUTH_USER_MODEL = "user.User"
 
+# "db" authenticates with authtoken rows; "jwt" additionally issues
+# short-lived signed access tokens and refresh tokens at /api/user/token/,
+# which are validated without a database query. Revocations spread through
+# the default cache, so "jwt" needs a shared one (REDIS_URL).
+AUTH_TOKEN_MODE = os.environ.get("AUTH_TOKEN_MODE", "db")
+
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
+        *(
+            ["user.authentication.StatelessTokenAuthentication"]
+            if AUTH_TOKEN_MODE == "jwt"
+            else []
+        ),
         "rest_framework.authentication.TokenAuthentication",
     ],
     "DEFAULT_PERMISSION_CLASSES": [],
+    "DEFAULT_RENDERER_CLASSES": [
+        "social_media_platform_api.renderers.ORJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
+    "DEFAULT_THROTTLE_RATES": {
+        "add_like.user": "60/min",
+        "add_like.ip": "300/min",
+        "add_comment.user": "20/min",
+        "add_comment.ip": "100/min",
+        "follow.user": "30/min",
+        "follow.ip": "150/min",
+        "register.ip": "10/hour",
+    },
+    # The number of reverse proxies in front of the app. Per-IP throttles
+    # take the client address that many hops from the end of
+    # X-Forwarded-For; with 0 they use REMOTE_ADDR and ignore the header,
+    # which clients can set to anything.
+    "NUM_PROXIES": int(os.environ.get("NUM_PROXIES", 0)),
+}
+
+SIMPLE_JWT = {
+    "ACCESS_TOKEN_LIFETIME": timedelta(minutes=5),
+    "REFRESH_TOKEN_LIFETIME": timedelta(days=1),
+    "AUTH_HEADER_TYPES": ("Bearer",),
 }
 
+# Signing keys by id, as "id:secret,id:secret". Tokens are signed with the
+# active key; every listed key still verifies, so add the new key, switch
+# JWT_ACTIVE_KEY_ID, and drop the old key once its tokens have expired.
+JWT_SIGNING_KEYS = dict(
+    item.split(":", 1)
+    for item in os.environ.get("JWT_SIGNING_KEYS", "").split(",")
+    if item
+) or {"default": SECRET_KEY}
+JWT_ACTIVE_KEY_ID = os.environ.get("JWT_ACTIVE_KEY_ID", next(iter(JWT_SIGNING_KEYS)))
+# How often each process picks up tokens revoked by other processes.
+JWT_REVOCATION_SYNC_SECONDS = 1
+# Access tokens revoked per expiry window (one access token lifetime) that
+# a revocation filter is first sized for; it grows past that, and keeps
+# false positives below JWT_REVOCATION_ERROR_RATE either way.
+JWT_REVOCATIONS_PER_WINDOW = 1000
+JWT_REVOCATION_ERROR_RATE = 1e-4
+
+# Side effects of writes are queued in the outbox table and delivered by
+# manage.py relay_outbox, in process ("local") or through Celery ("celery").
+OUTBOX_BACKEND = os.environ.get("OUTBOX_BACKEND", "local")
+OUTBOX_BATCH_SIZE = 100
+# Events that failed this often stay in the table for inspection.
+OUTBOX_MAX_ATTEMPTS = 10
+
+CELERY_BROKER_URL = os.environ.get("CELERY_BROKER_URL", os.environ.get("REDIS_URL"))
+CELERY_TASK_ACKS_LATE = True
+
+# The feed and ?ranked=1 lists score this many of the newest posts.
+FEED_CANDIDATES = 2000
+FEED_RECENCY_HALF_LIFE_HOURS = 24
+# Likes and comments this recent make up a user's author and tag interests.
+FEED_INTEREST_DAYS = 90
+FEED_RANKING_WEIGHTS = {
+    "recency": 1.0,
+    "like_velocity": 0.6,
+    "comment_velocity": 0.8,
+    "affinity": 1.2,
+    "tag_overlap": 0.7,
+}
+
+# The home screen shows this many feed posts, counts unread items up to
+# HOME_COUNTER_LIMIT, and lists the tags most used by the posts of the last
+# TRENDING_TAGS_HOURS, recomputed every TRENDING_TAGS_TIMEOUT seconds.
+HOME_FEED_PAGE_SIZE = 20
+HOME_COUNTER_LIMIT = 99
+TRENDING_TAGS_HOURS = 24
+TRENDING_TAGS_LIMIT = 10
+TRENDING_TAGS_TIMEOUT = 60
+# Threads that load the parts of the home screen concurrently, each keeping
+# its own database connection open. 0 loads them one after another.
+HOME_SCREEN_WORKERS = int(os.environ.get("HOME_SCREEN_WORKERS", 0))
+
+# Worker id (0-1023) in the snowflake ids this process generates; every
+# process inserting into the database needs its own. gunicorn workers use
+# SNOWFLAKE_WORKER_ID + their slot, so give each server a range of
+# ``workers`` ids and celery workers and cron jobs ids outside them.
+SNOWFLAKE_WORKER_ID = os.environ.get("SNOWFLAKE_WORKER_ID")
+
+# Build list responses from values() dicts instead of the list serializers.
+FAST_LIST_SERIALIZATION = True
+
+# Stream unpaginated JSON lists in chunks of this many rows instead of
+# rendering them in one piece.
+STREAMING_LISTS = True
+STREAMING_LIST_CHUNK_SIZE = 500
+
+# Per-process metric files are summed from here by /metrics; unset keeps
+# each process's metrics in memory. /metrics needs METRICS_TOKEN as a bearer
+# token; without it, it is only served with DEBUG on.
+METRICS_DIR = os.environ.get("METRICS_DIR")
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+
+# Sampling period of the on-demand profiler (X-Profile: 1 or ?_profile=1,
+# staff only).
+PROFILER_INTERVAL_SECONDS = 0.002
+
+# reap_deletions removes the rows of deleted users and posts this many at a
+# time, pausing between batches.
+DELETION_BATCH_SIZE = 500
+DELETION_PAUSE_SECONDS = 0.1
+
+# Likes and comments of posts older than this are moved to archive segments
+# by the archive_engagement command.
+ENGAGEMENT_ARCHIVE_AFTER_DAYS = 365
+
+# The OpenAPI schema is rendered once per code version. Set CODE_VERSION at
+# deploy time to skip hashing the sources on startup, and SCHEMA_CACHE_DIR to
+# share renderings between processes (see the build_schema command).
+CODE_VERSION = os.environ.get("CODE_VERSION")
+SCHEMA_CACHE_DIR = os.environ.get("SCHEMA_CACHE_DIR")
+
 SPECTACULAR_SETTINGS = {
     "TITLE": "Social media platform API",
     "DESCRIPTION": "Create profiles, make posts, comments and likes",
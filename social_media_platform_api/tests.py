@@ -0,0 +1,218 @@
+import json
+import os
+import shutil
+import tempfile
+
+from django.http import StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from django.urls import reverse
+from django.utils.http import http_date
+
+from social_media_platform_api import metrics
+from social_media_platform_api.metrics import (
+    INITIAL_FILE_SIZE,
+    FileStore,
+    MetricsMiddleware,
+    mark_process_dead,
+    render,
+)
+
+CONTENT = bytes(range(256)) * 4
+IMMUTABLE_NAME = "post_images/me-0c5f8a3e-7d1b-4c2a-9e6f-1a2b3c4d5e6f.png"
+
+
+class MediaTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media_root = tempfile.mkdtemp()
+        os.makedirs(os.path.join(cls.media_root, "post_images"))
+        for name in (IMMUTABLE_NAME, "post_images/legacy.png"):
+            with open(os.path.join(cls.media_root, name), "wb") as media_file:
+                media_file.write(CONTENT)
+        cls.settings_override = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.settings_override.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings_override.disable()
+        shutil.rmtree(cls.media_root)
+        super().tearDownClass()
+
+    def get(self, name=IMMUTABLE_NAME, **headers):
+        response = self.client.get(reverse("media", kwargs={"path": name}), **headers)
+        body = b"".join(response.streaming_content) if response.streaming else b""
+        return response, body
+
+    def test_whole_file(self):
+        response, body = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, CONTENT)
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        self.assertEqual(
+            response["Cache-Control"], "public, max-age=31536000, immutable"
+        )
+        response, _ = self.get("post_images/legacy.png")
+        self.assertEqual(response["Cache-Control"], "public, no-cache")
+
+    def test_ranges(self):
+        for header, start, end in (
+            ("bytes=10-19", 10, 19),
+            ("bytes=1000-", 1000, 1023),
+            ("bytes=-24", 1000, 1023),
+            ("bytes=1000-5000", 1000, 1023),
+        ):
+            response, body = self.get(HTTP_RANGE=header)
+            self.assertEqual(response.status_code, 206, header)
+            self.assertEqual(body, CONTENT[start : end + 1], header)
+            self.assertEqual(response["Content-Range"], f"bytes {start}-{end}/1024")
+            self.assertEqual(response["Content-Length"], str(end - start + 1))
+
+    def test_unsatisfiable_range(self):
+        for header in ("bytes=1024-", "bytes=5000-6000", "bytes=-0"):
+            response, _ = self.get(HTTP_RANGE=header)
+            self.assertEqual(response.status_code, 416, header)
+            self.assertEqual(response["Content-Range"], "bytes */1024")
+
+    def test_invalid_range_is_ignored(self):
+        for header in ("bytes=5-3", "bytes=0-1,5-9", "items=0-9", "bytes=-"):
+            response, body = self.get(HTTP_RANGE=header)
+            self.assertEqual(response.status_code, 200, header)
+            self.assertEqual(body, CONTENT, header)
+
+    def test_if_none_match(self):
+        response, _ = self.get()
+        etag = response["ETag"]
+        response, body = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+        self.assertEqual(body, b"")
+        response, _ = self.get(HTTP_IF_NONE_MATCH='"stale"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_if_range(self):
+        response, _ = self.get()
+        etag, last_modified = response["ETag"], response["Last-Modified"]
+        for if_range in (etag, last_modified):
+            response, _ = self.get(HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE=if_range)
+            self.assertEqual(response.status_code, 206, if_range)
+        # The file changed since: the whole new file, not a piece of it.
+        for if_range in ('"stale"', http_date(0)):
+            response, body = self.get(HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE=if_range)
+            self.assertEqual(response.status_code, 200, if_range)
+            self.assertEqual(body, CONTENT)
+
+
+class MetricsTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def store(self, pid):
+        store = FileStore(os.path.join(self.directory, f"metrics_{pid}.db"))
+        self.addCleanup(store.close)
+        return store
+
+    def key(self, metric, labels=(), suffix=""):
+        return json.dumps([metric.name + suffix, list(labels)])
+
+    def render(self):
+        with override_settings(METRICS_DIR=self.directory):
+            return render().splitlines()
+
+    def test_file_store_round_trip(self):
+        store = self.store(1)
+        values = {"a": 1.5, "é": -2.0, "x" * INITIAL_FILE_SIZE: 3.0}
+        for key, value in values.items():
+            store.add(key, value)
+        store.add("a", 1)
+        values["a"] = 2.5
+        self.assertEqual(FileStore.read(store._file.name), values)
+
+        # A reopened file keeps adding to the stored values.
+        store.close()
+        store = self.store(1)
+        store.add("a", 1)
+        store.add("b", 4)
+        self.assertEqual(
+            FileStore.read(store._file.name), {**values, "a": 3.5, "b": 4.0}
+        )
+
+    def test_processes_are_summed(self):
+        labels = ("posts/", "PostViewSet.list", "GET", "200")
+        for pid, count in ((1, 2), (2, 3)):
+            self.store(pid).add(self.key(metrics.requests_total, labels), count)
+        self.store(3).add(self.key(metrics.requests_in_flight), 1)
+
+        lines = self.render()
+        self.assertIn(
+            'http_requests_total{route="posts/",action="PostViewSet.list",'
+            'method="GET",status="200"} 5',
+            lines,
+        )
+        self.assertIn("http_requests_in_flight 1", lines)
+
+    def test_dead_processes_leave_counters(self):
+        store = self.store(1)
+        store.add(self.key(metrics.requests_in_flight), 2)
+        store.add(self.key(metrics.cache_requests, ("card", "hit")), 7)
+        mark_process_dead(1, self.directory)
+        mark_process_dead(2, self.directory)
+
+        lines = self.render()
+        self.assertIn("http_requests_in_flight 0", lines)
+        self.assertIn('cache_requests_total{cache="card",result="hit"} 7', lines)
+
+    def test_exposition(self):
+        labels = ('say "hi"\\', "line\nbreak")
+        store = self.store(1)
+        for bucket, count in (("0.01", 2), ("0.5", 1), ("+Inf", 1)):
+            store.add(
+                self.key(metrics.request_duration, labels + (bucket,), "_bucket"),
+                count,
+            )
+        store.add(self.key(metrics.request_duration, labels, "_sum"), 20.25)
+        store.add(self.key(metrics.request_duration, labels, "_count"), 4)
+
+        label_text = r'route="say \"hi\"\\",action="line\nbreak"'
+        name = "http_request_duration_seconds"
+        lines = self.render()
+        start = lines.index(f"# TYPE {name} histogram") + 1
+        self.assertEqual(
+            lines[start : start + 14],
+            [
+                f'{name}_bucket{{{label_text},le="{bucket}"}} {count}'
+                for bucket, count in (
+                    (0.005, 0),
+                    (0.01, 2),
+                    (0.025, 2),
+                    (0.05, 2),
+                    (0.1, 2),
+                    (0.25, 2),
+                    (0.5, 3),
+                    (1, 3),
+                    (2.5, 3),
+                    (5, 3),
+                    (10, 3),
+                    ("+Inf", 4),
+                )
+            ]
+            + [f"{name}_sum{{{label_text}}} 20.25", f"{name}_count{{{label_text}}} 4"],
+        )
+
+    def test_unread_stream_is_finished(self):
+        def in_flight():
+            return metrics._collect().get(self.key(metrics.requests_in_flight), 0)
+
+        request = RequestFactory().get("/stream/")
+        request.resolver_match = None
+        middleware = MetricsMiddleware(
+            lambda request: StreamingHttpResponse(iter([b"never read"]))
+        )
+        before = in_flight()
+        response = middleware(request)
+        self.assertEqual(in_flight(), before + 1)
+        response.close()
+        self.assertEqual(in_flight(), before)
+        response.close()
+        self.assertEqual(in_flight(), before)
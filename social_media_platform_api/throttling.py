@@ -0,0 +1,209 @@
+"""
+Token-bucket throttles for write-heavy endpoints.
+
+Buckets live in the cache named by ``THROTTLE_CACHE``. When that cache is
+Redis, every take is a single atomic Lua call; any other backend, or a Redis
+outage, falls back to a process-local bucket store. Rates come from
+``REST_FRAMEWORK["DEFAULT_THROTTLE_RATES"]`` under ``"<scope>.user"`` and
+``"<scope>.ip"`` keys, where the scope is the view's ``throttle_scope``.
+"""
+import hashlib
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.redis import RedisCache
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+from user.tokens import StatelessAccessToken
+
+try:
+    from redis.exceptions import RedisError
+except ImportError:  # pragma: no cover - redis is optional
+    RedisError = OSError
+
+TAKE_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local refill = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * refill)
+local allowed = 0
+local wait = 0
+if tokens >= 1 then
+    allowed = 1
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / refill
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / refill) + 1)
+return {allowed, tostring(wait)}
+"""
+
+DURATIONS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+MAX_LOCAL_BUCKETS = 100_000
+
+
+class LocalBucketStore:
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, refill):
+        now = time.monotonic()
+        with self._lock:
+            if len(self._buckets) > MAX_LOCAL_BUCKETS:
+                # Idle buckets refill to full anyway; start over instead of
+                # growing without bound.
+                self._buckets.clear()
+            tokens, ts = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - ts) * refill)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                return True, 0.0
+            self._buckets[key] = (tokens, now)
+            return False, (1 - tokens) / refill
+
+
+class RedisBucketStore:
+    def __init__(self, cache, fallback):
+        self.cache = cache
+        self.fallback = fallback
+        self._script = None
+
+    def take(self, key, capacity, refill):
+        key = self.cache.make_key(key)
+        try:
+            client = self.cache._cache.get_client(key, write=True)
+            if self._script is None:
+                self._script = client.register_script(TAKE_SCRIPT)
+            allowed, wait = self._script(keys=[key], args=[capacity, refill])
+        except RedisError:
+            return self.fallback.take(key, capacity, refill)
+        return bool(allowed), float(wait)
+
+
+_local_store = LocalBucketStore()
+_stores = {}
+
+
+def get_bucket_store():
+    alias = getattr(settings, "THROTTLE_CACHE", "default")
+    if alias not in _stores:
+        cache = caches[alias]
+        if isinstance(cache, RedisCache):
+            _stores[alias] = RedisBucketStore(cache, _local_store)
+        else:
+            _stores[alias] = _local_store
+    return _stores[alias]
+
+
+def parse_rate(rate):
+    """
+    Turn ``"30/min"`` into ``(capacity, tokens refilled per second)``.
+    """
+    num, period = rate.split("/")
+    capacity = int(num)
+    return capacity, capacity / DURATIONS[period[0]]
+
+
+class TokenBucketThrottle(BaseThrottle):
+    kind = None
+
+    def __init__(self):
+        self._wait = None
+
+    def get_rate(self, view):
+        scope = getattr(view, "throttle_scope", None)
+        if not scope:
+            return None
+        return api_settings.DEFAULT_THROTTLE_RATES.get(f"{scope}.{self.kind}")
+
+    def get_identity(self, request):
+        raise NotImplementedError
+
+    def allow_request(self, request, view):
+        rate = self.get_rate(view)
+        identity = self.get_identity(request)
+        if rate is None or identity is None:
+            return True
+
+        capacity, refill = parse_rate(rate)
+        key = f"throttle:{view.throttle_scope}:{self.kind}:{identity}"
+        allowed, self._wait = get_bucket_store().take(key, capacity, refill)
+        return allowed
+
+    def wait(self):
+        if not self._wait:
+            return None
+        return math.ceil(self._wait)
+
+
+class UserTokenBucketThrottle(TokenBucketThrottle):
+    """
+    Buckets keyed by the token in the Authorization header, so the request
+    can be rejected before the token is looked up in the database. The
+    authentication classes ignore the case of the scheme and extra
+    whitespace, so only the token itself names the bucket. Signed access
+    tokens change on every refresh; they are verified, which needs no
+    query, and name the bucket of the user they were issued to.
+    """
+
+    kind = "user"
+
+    def get_identity(self, request):
+        credentials = request.META.get("HTTP_AUTHORIZATION", "").split()
+        if len(credentials) != 2:
+            # No credentials, or ones every authentication class rejects.
+            return None
+        scheme, key = credentials
+        if settings.AUTH_TOKEN_MODE == "jwt" and scheme.lower() == "bearer":
+            try:
+                token = StatelessAccessToken(key)
+            except TokenError:
+                return None
+            return f"id:{token[jwt_settings.USER_ID_CLAIM]}"
+        return hashlib.sha256(key.encode()).hexdigest()[:32]
+
+
+class IPTokenBucketThrottle(TokenBucketThrottle):
+    """
+    Buckets keyed by the client address, taken from X-Forwarded-For only as
+    far as ``REST_FRAMEWORK["NUM_PROXIES"]`` trusted proxies added to it.
+    """
+
+    kind = "ip"
+
+    def get_identity(self, request):
+        return self.get_ident(request)
+
+
+WRITE_THROTTLES = [UserTokenBucketThrottle, IPTokenBucketThrottle]
+
+
+class ThrottleFirstMixin:
+    """
+    Check throttles before authentication and permissions, so shed requests
+    never reach the ORM.
+    """
+
+    throttle_scope = None
+
+    def initial(self, request, *args, **kwargs):
+        super().check_throttles(request)
+        self._throttles_checked = True
+        super().initial(request, *args, **kwargs)
+
+    def check_throttles(self, request):
+        if not getattr(self, "_throttles_checked", False):
+            super().check_throttles(request)
@@ -0,0 +1,47 @@
+"""
+Warm-up for preload-and-fork servers.
+
+``warm_up()`` does in the master process what every worker would otherwise
+do on its first requests: build the URL resolvers, fill model metadata
+caches by building the serializers' field maps, and render the OpenAPI
+schema. It then closes database connections, which must not be shared
+with forked workers, and freezes the collected heap so the garbage
+collector in the workers doesn't write to (and un-share) those pages.
+See ``gunicorn.conf.py``.
+"""
+import gc
+
+from django.db import connections
+from django.urls import get_resolver, reverse
+
+from social_media_platform_api.schema import prerender_schema
+
+
+def _warm_serializers():
+    from profile_services import serializers as profile_serializers
+    from user import serializers as user_serializers
+
+    for serializer_class in (
+        profile_serializers.PostSerializer,
+        profile_serializers.PostDetailSerializer,
+        profile_serializers.PostListSerializer,
+        profile_serializers.ProfileDetailSerializer,
+        profile_serializers.ProfileDetailUpdateSerializer,
+        profile_serializers.ProfileListSerializer,
+        profile_serializers.CommentSerializer,
+        user_serializers.UserSerializer,
+    ):
+        serializer_class().fields
+
+
+def warm_up():
+    resolver = get_resolver()
+    resolver.reverse_dict
+    reverse("profile_services:post-list")
+
+    _warm_serializers()
+    prerender_schema()
+
+    connections.close_all()
+    gc.collect()
+    gc.freeze()
@@ -1,12 +1,14 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as DjangoUserAdmin
 
+from profile_services.admin import SoftDeleteAdminMixin
+from profile_services.deletion import delete_user
 from user.models import User
 from django.utils.translation import gettext as _
 
 
 @admin.register(User)
-class UserAdmin(DjangoUserAdmin):
+class UserAdmin(SoftDeleteAdminMixin, DjangoUserAdmin):
     fieldsets = (
         (None, {"fields": ("username", "email", "password")}),
         (_("Personal info"), {"fields": ("first_name", "last_name")}),
@@ -36,3 +38,4 @@ class UserAdmin(DjangoUserAdmin):
     list_display = ("username", "email", "first_name", "last_name", "is_staff")
     search_fields = ("username", "email", "first_name", "last_name")
     ordering = ("email",)
+    soft_delete = staticmethod(delete_user)
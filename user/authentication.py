@@ -0,0 +1,56 @@
+from django.contrib.auth import get_user_model
+from django.utils.functional import SimpleLazyObject
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings
+
+from user.tokens import StatelessAccessToken, revocations
+
+
+class TokenUser(SimpleLazyObject):
+    """
+    The user named by a validated access token. ``id``, ``pk`` and
+    ``is_staff`` come from the token claims; the user row is only loaded
+    when anything else is read from it.
+    """
+
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, token):
+        user_id = token[api_settings.USER_ID_CLAIM]
+        super().__init__(lambda: get_user_model().objects.get(pk=user_id))
+        self.__dict__["_claims"] = (user_id, token.get("is_staff", False))
+
+    def __bool__(self):
+        return True
+
+    @property
+    def id(self):
+        return self.__dict__["_claims"][0]
+
+    pk = id
+
+    @property
+    def is_staff(self):
+        return self.__dict__["_claims"][1]
+
+
+class StatelessTokenAuthentication(JWTAuthentication):
+    """
+    Authenticates signed access tokens without touching the database.
+    """
+
+    def get_validated_token(self, raw_token):
+        try:
+            token = StatelessAccessToken(raw_token)
+        except TokenError as error:
+            raise InvalidToken({"detail": str(error)})
+        if token in revocations:
+            raise InvalidToken({"detail": "Token has been revoked"})
+        return token
+
+    def get_user(self, validated_token):
+        if api_settings.USER_ID_CLAIM not in validated_token:
+            raise InvalidToken("Token contained no recognizable user identification")
+        return TokenUser(validated_token)
@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.core import checks
+
+from social_media_platform_api.caches import is_shared
+
+
+@checks.register(checks.Tags.security)
+def check_revocation_cache(app_configs, **kwargs):
+    # Revoked JWTs reach the other processes through the default cache.
+    if settings.AUTH_TOKEN_MODE != "jwt" or is_shared("default"):
+        return []
+    return [
+        checks.Error(
+            "AUTH_TOKEN_MODE = 'jwt' needs a cache shared by all processes, "
+            "or a revoked token stays valid in every process but one.",
+            hint="Set REDIS_URL.",
+            id="user.E001",
+        )
+    ]
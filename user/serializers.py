@@ -1,8 +1,12 @@
 from django.contrib.auth import get_user_model, authenticate
 from rest_framework import serializers
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
 
 from django.utils.translation import gettext as _
 
+from user.tokens import StatelessRefreshToken, refresh_revocations
+
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -29,6 +33,7 @@ class UserSerializer(serializers.ModelSerializer):
         if password:
             user.set_password(password)
             user.save()
+        return user
 
 
 class AuthTokenSerializer(serializers.Serializer):
@@ -59,3 +64,43 @@ class AuthTokenSerializer(serializers.Serializer):
 
         attrs["user"] = user
         return attrs
+
+
+class TokenPairSerializer(AuthTokenSerializer):
+    token = None
+    access = serializers.CharField(read_only=True)
+    refresh = serializers.CharField(read_only=True)
+
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+        refresh = StatelessRefreshToken.for_user(attrs["user"])
+        return {"refresh": str(refresh), "access": str(refresh.access_token)}
+
+
+class TokenRefreshSerializer(serializers.Serializer):
+    refresh = serializers.CharField()
+    access = serializers.CharField(read_only=True)
+
+    def validate(self, attrs):
+        try:
+            refresh = StatelessRefreshToken(attrs["refresh"])
+        except TokenError as error:
+            raise InvalidToken({"detail": str(error)})
+        if refresh in refresh_revocations:
+            raise InvalidToken({"detail": "Token has been revoked"})
+
+        # Refreshing is the one point where a deactivated or demoted user is
+        # noticed, so it reads the user row.
+        user = (
+            get_user_model()
+            .objects.filter(pk=refresh[jwt_settings.USER_ID_CLAIM], is_active=True)
+            .first()
+        )
+        if user is None:
+            raise InvalidToken({"detail": "User is inactive or deleted"})
+
+        if not refresh_revocations.revoke(refresh):
+            # Another request refreshed with it first.
+            raise InvalidToken({"detail": "Token has been revoked"})
+        refresh = StatelessRefreshToken.for_user(user)
+        return {"refresh": str(refresh), "access": str(refresh.access_token)}
@@ -1,3 +1,243 @@
-from django.test import TestCase
+import time
+import uuid
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core import checks
+from django.core.cache import cache
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient, APIRequestFactory
+
+from social_media_platform_api.throttling import (
+    IPTokenBucketThrottle,
+    UserTokenBucketThrottle,
+)
+from user.tokens import (
+    REVOCATION_ENTRY_KEY,
+    REVOCATION_SEQUENCE_KEY,
+    RevocationFilter,
+    StatelessRefreshToken,
+)
+from user.views import CreateTokenPairView, RefreshTokenView
+
+PASSWORD = "a-long-password"
+
+# The most queries each action may issue, whatever the number of users.
+QUERY_BUDGETS = {
+    "register": 3,
+    "login": 5,
+    "me": 1,
+    "me-update": 3,
+    "log-out": 3,
+    "token-pair": 1,
+    "token-refresh": 1,
+}
+
+
+class QueryBudgetTests:
+    """
+    Runs every user action and fails when one issues more queries than
+    ``QUERY_BUDGETS`` allows, against a small and a large set of users.
+    """
+
+    scale = None
+
+    @classmethod
+    def setUpTestData(cls):
+        get_user_model().objects.bulk_create(
+            get_user_model()(email=f"user{i}@example.com", username=f"user{i}")
+            for i in range(cls.scale)
+        )
+        cls.user = get_user_model().objects.create_user(
+            email="me@example.com", password=PASSWORD, username="me"
+        )
+
+    def setUp(self):
+        # Registration is throttled per IP.
+        cache.clear()
+
+    def assertQueryBudget(self, label, send):
+        with CaptureQueriesContext(connection) as queries:
+            response = send()
+        self.assertLess(response.status_code, 400, (label, response.data))
+        self.assertLessEqual(
+            len(queries),
+            QUERY_BUDGETS[label],
+            f"{label} at scale {self.scale}:\n"
+            + "\n".join(query["sql"] for query in queries),
+        )
+        return response
+
+    def test_token_actions(self):
+        client = APIClient()
+        self.assertQueryBudget(
+            "register",
+            lambda: client.post(
+                reverse("user:create"),
+                {"email": "new@example.com", "password": PASSWORD, "username": "new"},
+            ),
+        )
+        response = self.assertQueryBudget(
+            "login",
+            lambda: client.post(
+                reverse("user:token"),
+                {"email": "me@example.com", "password": PASSWORD},
+            ),
+        )
+        client.credentials(HTTP_AUTHORIZATION=f"Token {response.data['token']}")
+        self.assertQueryBudget("me", lambda: client.get(reverse("user:manage")))
+        self.assertQueryBudget(
+            "me-update",
+            lambda: client.patch(reverse("user:manage"), {"username": "renamed"}),
+        )
+        self.assertQueryBudget("log-out", lambda: client.post(reverse("user:log_out")))
+        self.assertFalse(Token.objects.filter(user=self.user).exists())
+
+    def test_jwt_actions(self):
+        # The views are only routed with AUTH_TOKEN_MODE=jwt; call them
+        # directly so the budgets hold in either mode.
+        factory = APIRequestFactory()
+        response = self.assertQueryBudget(
+            "token-pair",
+            lambda: CreateTokenPairView.as_view()(
+                factory.post(
+                    "/",
+                    {"email": "me@example.com", "password": PASSWORD},
+                    format="json",
+                )
+            ),
+        )
+        self.assertQueryBudget(
+            "token-refresh",
+            lambda: RefreshTokenView.as_view()(
+                factory.post("/", {"refresh": response.data["refresh"]}, format="json")
+            ),
+        )
+
+
+class SmallQueryBudgetTests(QueryBudgetTests, TestCase):
+    scale = 2
+
+
+class LargeQueryBudgetTests(QueryBudgetTests, TestCase):
+    scale = 200
+
+
+class RevocationCacheCheckTests(TestCase):
+    def errors(self):
+        return [
+            message.id
+            for message in checks.run_checks(tags=[checks.Tags.security])
+            if message.level >= checks.ERROR
+        ]
+
+    @override_settings(AUTH_TOKEN_MODE="jwt")
+    def test_jwt_needs_shared_cache(self):
+        self.assertIn("user.E001", self.errors())
+        redis = {"BACKEND": "django.core.cache.backends.redis.RedisCache"}
+        with override_settings(CACHES={"default": redis}):
+            self.assertNotIn("user.E001", self.errors())
+
+    def test_db_tokens(self):
+        self.assertNotIn("user.E001", self.errors())
+
+
+class UserThrottleTests(SimpleTestCase):
+    def test_one_bucket_per_token(self):
+        factory = APIRequestFactory()
+        throttle = UserTokenBucketThrottle()
+        identities = {
+            throttle.get_identity(factory.get("/", HTTP_AUTHORIZATION=credentials))
+            for credentials in ("Token abc", "token abc", "TOKEN  abc ", "Token\tabc")
+        }
+        self.assertEqual(len(identities), 1)
+        self.assertNotIn(None, identities)
+
+    @override_settings(AUTH_TOKEN_MODE="jwt")
+    def test_one_bucket_per_jwt_user(self):
+        factory = APIRequestFactory()
+        throttle = UserTokenBucketThrottle()
+        user = get_user_model()(pk=7, email="me@example.com", username="me")
+        refresh = StatelessRefreshToken.for_user(user)
+        identities = {
+            throttle.get_identity(
+                factory.get("/", HTTP_AUTHORIZATION=f"Bearer {access}")
+            )
+            for access in (refresh.access_token, refresh.access_token)
+        }
+        self.assertEqual(identities, {"id:7"})
+        forged = factory.get("/", HTTP_AUTHORIZATION="Bearer not.a.token")
+        self.assertIsNone(throttle.get_identity(forged))
+
+    def test_ip_ignores_forwarded_for(self):
+        factory = APIRequestFactory()
+        throttle = IPTokenBucketThrottle()
+        identities = {
+            throttle.get_identity(factory.get("/", HTTP_X_FORWARDED_FOR=f"10.0.0.{i}"))
+            for i in range(3)
+        }
+        self.assertEqual(identities, {"127.0.0.1"})
+
+
+class RevocationFilterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_false_positives_stay_rare(self):
+        revocations = RevocationFilter(300)
+        exp = time.time() + 60
+        for _ in range(20_000):
+            revocations.add(uuid.uuid4().hex, exp)
+        false_positives = sum(
+            {"jti": uuid.uuid4().hex, "exp": exp} in revocations for _ in range(20_000)
+        )
+        self.assertLess(false_positives, 20)
+
+    def test_catch_up_starts_at_live_revocations(self):
+        # A day of revocations by other processes, all long expired.
+        cache.set(REVOCATION_SEQUENCE_KEY, 100_000, timeout=None)
+        token = {"jti": uuid.uuid4().hex, "exp": time.time() + 60}
+        RevocationFilter(300).revoke(token)
+
+        fresh = RevocationFilter(300)
+        with CaptureCacheKeys() as keys:
+            self.assertIn(token, fresh)
+        self.assertEqual(keys.entries, [REVOCATION_ENTRY_KEY.format(100_001)])
+
+    def test_refresh_token_is_single_use(self):
+        user = get_user_model().objects.create_user(
+            email="me@example.com", password=PASSWORD, username="me"
+        )
+        refresh = str(StatelessRefreshToken.for_user(user))
+        factory = APIRequestFactory()
+        responses = [
+            RefreshTokenView.as_view()(
+                factory.post("/", {"refresh": refresh}, format="json")
+            )
+            for _ in range(2)
+        ]
+        self.assertEqual([response.status_code for response in responses], [200, 401])
+
+
+class CaptureCacheKeys:
+    """
+    Records the revocation entries read through ``cache.get_many``.
+    """
+
+    def __enter__(self):
+        self.entries = []
+        self._get_many = cache.get_many
+
+        def get_many(keys):
+            keys = list(keys)
+            self.entries += [key for key in keys if key.startswith("jwt-revocation:")]
+            return self._get_many(keys)
+
+        cache.get_many = get_many
+        return self
+
+    def __exit__(self, *exc_info):
+        del cache.get_many
@@ -0,0 +1,254 @@
+"""
+Short-lived signed access tokens and refresh tokens (``AUTH_TOKEN_MODE =
+"jwt"``).
+
+Tokens are signed with the key named by ``JWT_ACTIVE_KEY_ID`` and carry its
+id in the ``kid`` header. Any key still listed in ``JWT_SIGNING_KEYS``
+verifies, so keys rotate by adding the new one, switching the active id and
+dropping the old key once its tokens have expired.
+
+Revoked access token ids are kept in per-expiry-window Bloom filters in
+process memory, so checking a token needs no database or cache round trip.
+Each window's filter is sized for ``JWT_REVOCATIONS_PER_WINDOW`` ids and
+grows when more arrive, keeping false positives (a 401 the client answers
+by refreshing) near ``JWT_REVOCATION_ERROR_RATE``. Revocations reach other
+processes through the default cache within ``JWT_REVOCATION_SYNC_SECONDS``,
+so the cache must be shared (check ``user.E001``).
+
+Refresh tokens are only checked when they are used, so their revocations
+are looked up in the cache directly and are exact.
+"""
+import hashlib
+import math
+import threading
+import time
+
+import jwt
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework_simplejwt.backends import TokenBackend
+from rest_framework_simplejwt.exceptions import TokenBackendError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+REVOCATION_SEQUENCE_KEY = "jwt-revocation-seq"
+REVOCATION_ENTRY_KEY = "jwt-revocation:{}"
+# The first sequence number handed out in a window of revocation times.
+REVOCATION_START_KEY = "jwt-revocation-start:{}"
+REFRESH_REVOCATION_KEY = "jwt-revoked-refresh:{}"
+
+
+class KeyRotatingTokenBackend(TokenBackend):
+    def __init__(self):
+        super().__init__(
+            api_settings.ALGORITHM,
+            signing_key=settings.JWT_SIGNING_KEYS[settings.JWT_ACTIVE_KEY_ID],
+            audience=api_settings.AUDIENCE,
+            issuer=api_settings.ISSUER,
+            leeway=api_settings.LEEWAY,
+        )
+
+    def encode(self, payload):
+        jwt_payload = payload.copy()
+        if self.audience is not None:
+            jwt_payload["aud"] = self.audience
+        if self.issuer is not None:
+            jwt_payload["iss"] = self.issuer
+        return jwt.encode(
+            jwt_payload,
+            settings.JWT_SIGNING_KEYS[settings.JWT_ACTIVE_KEY_ID],
+            algorithm=self.algorithm,
+            headers={"kid": settings.JWT_ACTIVE_KEY_ID},
+        )
+
+    def get_verifying_key(self, token):
+        try:
+            key_id = jwt.get_unverified_header(token).get("kid")
+        except jwt.InvalidTokenError:
+            raise TokenBackendError("Token is invalid or expired")
+        try:
+            return settings.JWT_SIGNING_KEYS[key_id]
+        except KeyError:
+            raise TokenBackendError("Token is signed with an unknown key")
+
+
+token_backend = KeyRotatingTokenBackend()
+
+
+class StatelessAccessToken(AccessToken):
+    def get_token_backend(self):
+        return token_backend
+
+
+class StatelessRefreshToken(RefreshToken):
+    access_token_class = StatelessAccessToken
+
+    def get_token_backend(self):
+        return token_backend
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        # Carried into access tokens so staff checks need no user lookup.
+        token["is_staff"] = user.is_staff
+        return token
+
+
+class BloomFilter:
+    """
+    Sized to hold ``capacity`` values with a false-positive rate of
+    ``error_rate``.
+    """
+
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.count = 0
+        self.bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.hashes = max(1, round(self.bits / capacity * math.log(2)))
+        self.array = bytearray((self.bits + 7) // 8)
+
+    def _positions(self, value):
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        step = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.hashes):
+            yield (first + i * step) % self.bits
+
+    def add(self, value):
+        for position in self._positions(value):
+            self.array[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, value):
+        return all(
+            self.array[position >> 3] & (1 << (position & 7))
+            for position in self._positions(value)
+        )
+
+
+class WindowFilter:
+    """
+    The revoked ids of one window. When a filter fills up the next one is
+    twice as large with half the error rate, so the rate of the whole stays
+    below ``error_rate`` however many ids arrive.
+    """
+
+    def __init__(self, capacity, error_rate):
+        self.filters = [BloomFilter(capacity, error_rate / 2)]
+
+    def add(self, value):
+        last = self.filters[-1]
+        if last.count >= last.capacity:
+            last = BloomFilter(last.capacity * 2, last.error_rate / 2)
+            self.filters.append(last)
+        last.add(value)
+
+    def __contains__(self, value):
+        return any(value in bloom for bloom in self.filters)
+
+
+class RevocationFilter:
+    """
+    Revoked access token ids, one filter per window of expiry times. A
+    window is dropped once every token that could be in it has expired.
+    """
+
+    def __init__(self, window_seconds):
+        self.window_seconds = window_seconds
+        self._filters = {}
+        self._lock = threading.Lock()
+        self._seen_sequence = 0
+        self._synced_at = 0.0
+
+    def _window(self, exp):
+        return int(exp) // self.window_seconds
+
+    def add(self, jti, exp):
+        with self._lock:
+            window = self._window(exp)
+            if window not in self._filters:
+                self._filters[window] = WindowFilter(
+                    settings.JWT_REVOCATIONS_PER_WINDOW,
+                    settings.JWT_REVOCATION_ERROR_RATE,
+                )
+            self._filters[window].add(jti)
+
+    def __contains__(self, token):
+        self._sync()
+        window = self._filters.get(self._window(token["exp"]))
+        return window is not None and token[api_settings.JTI_CLAIM] in window
+
+    def _prune(self, now):
+        current = self._window(now)
+        for window in [window for window in self._filters if window < current]:
+            del self._filters[window]
+
+    def _sync(self):
+        now = time.time()
+        if now - self._synced_at < settings.JWT_REVOCATION_SYNC_SECONDS:
+            return
+        self._synced_at = now
+
+        # An access token revoked more than one lifetime ago has expired, so
+        # a process catches up from the start of the window before that at
+        # the earliest, however long it has been away.
+        current = self._window(now)
+        windows = range(current - 2, current + 1)
+        state = cache.get_many(
+            [REVOCATION_SEQUENCE_KEY]
+            + [REVOCATION_START_KEY.format(window) for window in windows]
+        )
+        sequence = state.pop(REVOCATION_SEQUENCE_KEY, 0)
+        if sequence > self._seen_sequence:
+            # No mark means nothing was revoked in those windows.
+            first = max(
+                self._seen_sequence + 1, min(state.values(), default=sequence + 1)
+            )
+            entries = cache.get_many(
+                REVOCATION_ENTRY_KEY.format(n) for n in range(first, sequence + 1)
+            )
+            for jti, exp in entries.values():
+                self.add(jti, exp)
+            self._seen_sequence = sequence
+        with self._lock:
+            self._prune(now)
+
+    def revoke(self, token):
+        jti = token[api_settings.JTI_CLAIM]
+        exp = token["exp"]
+        self.add(jti, exp)
+
+        # Marked before taking a number, so no revocation of this window
+        # gets a number below the mark.
+        cache.add(REVOCATION_SEQUENCE_KEY, 0, timeout=None)
+        cache.add(
+            REVOCATION_START_KEY.format(self._window(time.time())),
+            cache.get(REVOCATION_SEQUENCE_KEY, 0) + 1,
+            timeout=self.window_seconds * 4,
+        )
+        sequence = cache.incr(REVOCATION_SEQUENCE_KEY)
+        timeout = max(int(exp - time.time()), 1)
+        cache.set(REVOCATION_ENTRY_KEY.format(sequence), (jti, exp), timeout)
+
+
+class RefreshRevocations:
+    """
+    Revoked refresh token ids, one cache key each until the token expires.
+    """
+
+    def __contains__(self, token):
+        jti = token[api_settings.JTI_CLAIM]
+        return cache.get(REFRESH_REVOCATION_KEY.format(jti)) is not None
+
+    def revoke(self, token):
+        """
+        Return False when the token had already been revoked.
+        """
+        timeout = max(int(token["exp"] - time.time()), 1)
+        jti = token[api_settings.JTI_CLAIM]
+        return cache.add(REFRESH_REVOCATION_KEY.format(jti), True, timeout)
+
+
+revocations = RevocationFilter(int(api_settings.ACCESS_TOKEN_LIFETIME.total_seconds()))
+refresh_revocations = RefreshRevocations()
@@ -1,5 +1,13 @@
+from django.conf import settings
 from django.urls import path
-from user.views import CreateUserView, ManageUserView, CreateTokenView, LogOutView
+from user.views import (
+    CreateUserView,
+    ManageUserView,
+    CreateTokenView,
+    LogOutView,
+    CreateTokenPairView,
+    RefreshTokenView,
+)
 
 app_name = "user"
 
@@ -9,3 +17,9 @@ urlpatterns = [
     path("me/", ManageUserView.as_view(), name="manage"),
     path("log_out/", LogOutView.as_view(), name="log_out"),
 ]
+
+if settings.AUTH_TOKEN_MODE == "jwt":
+    urlpatterns += [
+        path("token/", CreateTokenPairView.as_view(), name="token_pair"),
+        path("token/refresh/", RefreshTokenView.as_view(), name="token_refresh"),
+    ]
@@ -1,5 +1,4 @@
 from rest_framework import generics, status
-from rest_framework.authentication import TokenAuthentication
 from rest_framework.authtoken.models import Token
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.generics import get_object_or_404
@@ -8,12 +7,30 @@ from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
 from rest_framework.settings import api_settings
 from rest_framework.views import APIView
+from rest_framework_simplejwt.exceptions import TokenError
 
-from user.serializers import UserSerializer, AuthTokenSerializer
+from social_media_platform_api.throttling import (
+    IPTokenBucketThrottle,
+    ThrottleFirstMixin,
+)
+from user.serializers import (
+    UserSerializer,
+    AuthTokenSerializer,
+    TokenPairSerializer,
+    TokenRefreshSerializer,
+)
+from user.tokens import (
+    StatelessAccessToken,
+    StatelessRefreshToken,
+    refresh_revocations,
+    revocations,
+)
 
 
-class CreateUserView(generics.CreateAPIView):
+class CreateUserView(ThrottleFirstMixin, generics.CreateAPIView):
     serializer_class = UserSerializer
+    throttle_classes = (IPTokenBucketThrottle,)
+    throttle_scope = "register"
 
 
 class CreateTokenView(ObtainAuthToken):
@@ -21,9 +38,25 @@ class CreateTokenView(ObtainAuthToken):
     serializer_class = AuthTokenSerializer
 
 
+class CreateTokenPairView(generics.GenericAPIView):
+    serializer_class = TokenPairSerializer
+    authentication_classes = ()
+
+    def get_authenticate_header(self, request):
+        return 'Bearer realm="api"'
+
+    def post(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response(serializer.validated_data, status=status.HTTP_200_OK)
+
+
+class RefreshTokenView(CreateTokenPairView):
+    serializer_class = TokenRefreshSerializer
+
+
 class ManageUserView(generics.RetrieveUpdateAPIView):
     serializer_class = UserSerializer
-    authentication_classes = (TokenAuthentication,)
     permission_classes = (IsAuthenticated,)
 
     def get_object(self):
@@ -31,10 +64,19 @@ class ManageUserView(generics.RetrieveUpdateAPIView):
 
 
 class LogOutView(APIView):
-    authentication_classes = (TokenAuthentication,)
     permission_classes = (IsAuthenticated,)
 
     def post(self, request):
-        token = get_object_or_404(Token, user=request.user)
-        token.delete()
+        if isinstance(request.auth, StatelessAccessToken):
+            revocations.revoke(request.auth)
+            if request.data.get("refresh"):
+                try:
+                    refresh_revocations.revoke(
+                        StatelessRefreshToken(request.data["refresh"])
+                    )
+                except TokenError:
+                    pass
+        else:
+            token = get_object_or_404(Token, user=request.user)
+            token.delete()
         return Response({"detail": "Succesfully log out"}, status=status.HTTP_200_OK)